@@ -1,92 +1,72 @@
+from __future__ import annotations
+
 import csv
-import json
-import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Iterable, Iterator
+from typing import Iterator
 
-import requests
+# Token handling and the player helpers (on the shared retrying SESSION) come from update_player_city
+from update_player_city import (
+    CSV_FILE,
+    TokenManager,
+    build_player_index,
+    call_with_token,
+    fetch_player,
+    fetch_players,
+    get_api_credentials,
+    iter_csv_rows,
+)
 
 
-CSV_FILE = Path("_1ec01f0כרטיס מכשיר(DataSheet).csv")
-API_BASE_URL = "https://m4d-srv.ctv.co.il/media4display-api"
 OUTPUT_FILE = Path("missing_player_attributes.csv")
-
-
-def iter_csv_rows(path: Path, encodings: Iterable[str]) -> Iterator[list[str]]:
-    for encoding in encodings:
-        try:
-            with path.open("r", encoding=encoding, newline="") as fh:
-                reader = csv.reader(fh)
-                header = next(reader, None)
-                if header is None:
-                    continue
-                yield header
-                for row in reader:
-                    yield row
-                return
-        except Exception:
-            continue
-    raise RuntimeError(f"Unable to read CSV file {path} with provided encodings.")
-
-
-def get_api_credentials() -> tuple[str, str]:
+SITE_COLUMN = "מספר אתר/תאור אתר"
+# Variables that must be non-empty on every player
+REQUIRED_NAMES = frozenset({"M4DS_Reseller", "M4DS_ISP"})
+# Streaming flags only need to be present ("false" is a valid value)
+STREAMING_NAMES = frozenset({
+    "M4DS_StreamingHot_Muted",
+    "M4DS_StreamingTriple_Muted",
+    "M4DS_StreamingVerticalHot_Muted",
+    "M4DS_StreamingVerticalTriple_Muted",
+})
+# Every variable player_has_missing_attributes looks for
+CHECKED_NAMES = REQUIRED_NAMES | STREAMING_NAMES
+# Concurrent fetch_player calls per site
+MAX_WORKERS = 4
+# Sites audited at the same time
+MAX_SITE_WORKERS = 8
+
+# Full player details by player id, filled by fetch_player_cached (read-only audit)
+PLAYER_CACHE: dict[int, dict] = {}
+
+
+def iter_csv_column(path: Path, column: str) -> Iterator[str]:
     """
-    Prompt the user for the API key and organization (same as in update_player_city.py).
+    Read the CSV file through the shared reader and yield the value of a
+    single column for every row (rows too short to have it are skipped).
     """
-    api_key = input("Enter API key: ").strip()
-    if not api_key:
-        raise RuntimeError("API key is required.")
-
-    organization = os.environ.get("M4D_ORG")
-    if not organization:
-        organization = input("Enter organization: ").strip()
-    if not organization:
-        raise RuntimeError("Organization is required.")
-
-    return api_key, organization
-
-
-def request_token(api_key: str, organization: str) -> str:
-    resp = requests.post(
-        f"{API_BASE_URL}/v1/token",
-        json={"apiKey": api_key, "organization": organization},
-        timeout=30,
-    )
-    resp.raise_for_status()
-    return resp.text.strip('"')
-
-
-def fetch_players(token: str) -> list[dict]:
-    resp = requests.get(
-        f"{API_BASE_URL}/v1/players",
-        headers={"Authorization": f"Bearer {token}"},
-        timeout=60,
-    )
-    resp.raise_for_status()
-    return resp.json()
-
+    reader = iter_csv_rows(path)
+    header = next(reader, None) or []
+    try:
+        idx = header.index(column)
+    except ValueError as exc:
+        raise RuntimeError(f"Column '{column}' not found in CSV header.") from exc
 
-def fetch_player(token: str, player_id: int) -> dict:
-    resp = requests.get(
-        f"{API_BASE_URL}/v1/players/{player_id}",
-        headers={"Authorization": f"Bearer {token}"},
-        timeout=60,
-    )
-    resp.raise_for_status()
-    return resp.json()
+    for row in reader:
+        if len(row) > idx:
+            yield row[idx]
 
 
-def filter_players_by_site(players: Iterable[dict], site_id: str) -> list[dict]:
+def fetch_player_cached(tm: TokenManager, player_id: int) -> dict:
     """
-    Reuse the same matching logic as update_player_city.py:
-    site id appears in identifier or name.
+    Fetch a player once per run. A player whose identifier/name matches
+    several site ids is otherwise re-fetched for every one of them.
     """
-    return [
-        player
-        for player in players
-        if site_id in (player.get("identifier", "") or "")
-        or site_id in (player.get("name", "") or "")
-    ]
+    player = PLAYER_CACHE.get(player_id)
+    if player is None:
+        player = call_with_token(tm, fetch_player, player_id)
+        PLAYER_CACHE[player_id] = player
+    return player
 
 
 def player_has_missing_attributes(player: dict) -> bool:
@@ -110,44 +90,33 @@ def player_has_missing_attributes(player: dict) -> bool:
     else:
         vars_list = []
 
-    def get_var(name: str) -> str | None:
-        for item in vars_list:
-            if not isinstance(item, dict):
-                continue
-            if item.get("name") == name:
-                return item.get("value")
-        return None
-
-    reseller = get_var("M4DS_Reseller")
-    isp = get_var("M4DS_ISP")
-    if not reseller or not isp:
-        return True
-
-    streaming_names = [
-        "M4DS_StreamingHot_Muted",
-        "M4DS_StreamingTriple_Muted",
-        "M4DS_StreamingVerticalHot_Muted",
-        "M4DS_StreamingVerticalTriple_Muted",
-    ]
-    for name in streaming_names:
-        val = get_var(name)
-        if val is None or val == "":
-            return True
+    # Single pass: drop each variable from the pending set once it has a value
+    pending = set(CHECKED_NAMES)
+    for item in vars_list:
+        if not isinstance(item, dict):
+            continue
+        name = item.get("name")
+        if name not in pending:
+            continue
+        value = item.get("value")
+        has_value = bool(value) if name in REQUIRED_NAMES else value not in (None, "")
+        if has_value:
+            pending.discard(name)
+            if not pending:
+                return False
 
-    return False
+    return bool(pending)
 
 
 def audit_site(
     site_id: str,
-    players_cache: list[dict],
-    api_key: str,
-    organization: str,
+    player_index: dict[str, list[dict]],
+    tm: TokenManager,
 ) -> bool:
     """
     Return True if this site_id has at least one player with missing attributes.
     """
-    token = request_token(api_key, organization)
-    target_players = filter_players_by_site(players_cache, site_id)
+    target_players = player_index.get(site_id, [])
 
     if not target_players:
         print(f"[INFO] No players found for site {site_id}.")
@@ -155,69 +124,86 @@ def audit_site(
 
     print(f"[INFO] Found {len(target_players)} player(s) for site {site_id}. Checking...")
 
-    for player in target_players:
-        player_id = player.get("playerId") or player.get("id")
-        identifier = (player.get("identifier") or player.get("name", "")).strip()
-        if player_id is None:
-            print(f"[WARN] Skipping player without id (site {site_id}, identifier {identifier!r})")
-            continue
+    def check_player(player_id: int) -> bool:
+        full_player = fetch_player_cached(tm, player_id)
+        return player_has_missing_attributes(full_player)
 
-        try:
-            token = request_token(api_key, organization)  # fresh token per player
-            full_player = fetch_player(token, int(player_id))
-            if player_has_missing_attributes(full_player):
+    executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    futures = {}
+    try:
+        for player in target_players:
+            player_id = player.get("playerId") or player.get("id")
+            identifier = (player.get("identifier") or player.get("name", "")).strip()
+            if player_id is None:
+                print(f"[WARN] Skipping player without id (site {site_id}, identifier {identifier!r})")
+                continue
+            futures[executor.submit(check_player, int(player_id))] = (player_id, identifier)
+
+        for future in as_completed(futures):
+            player_id, identifier = futures[future]
+            try:
+                if future.result():
+                    print(
+                        f"[INFO] Site {site_id}: player {identifier} (id {player_id}) "
+                        f"has missing attributes."
+                    )
+                    return True
+            except Exception as exc:
                 print(
-                    f"[INFO] Site {site_id}: player {identifier} (id {player_id}) "
-                    f"has missing attributes."
+                    f"[WARN] Failed to check player {identifier} (id {player_id}) for site {site_id}: {exc}"
                 )
-                return True
-        except Exception as exc:
-            print(
-                f"[WARN] Failed to check player {identifier} (id {player_id}) for site {site_id}: {exc}"
-            )
+    finally:
+        # Stop pending checks as soon as one player with missing attributes is found
+        # (Future.cancel per future; shutdown(cancel_futures=True) needs Python 3.9)
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
 
     return False
 
 
+def collect_site_ids(csv_path: Path) -> list[str]:
+    """
+    Return the unique, non-empty site ids from the CSV in file order.
+    """
+    site_ids = dict.fromkeys(value.strip() for value in iter_csv_column(csv_path, SITE_COLUMN))
+    site_ids.pop("", None)
+    return list(site_ids)
+
+
+def audit_sites(site_ids: list[str], players_cache: list[dict], tm: TokenManager) -> list[str]:
+    """
+    Audit all sites concurrently and return the site ids (in input order)
+    that have at least one player with missing attributes.
+    """
+    # Match all players to all sites once instead of scanning players per site
+    player_index = build_player_index(players_cache, site_ids)
+
+    with ThreadPoolExecutor(max_workers=MAX_SITE_WORKERS) as executor:
+        has_missing = executor.map(lambda site_id: audit_site(site_id, player_index, tm), site_ids)
+        return [site_id for site_id, missing in zip(site_ids, has_missing) if missing]
+
+
 def main() -> None:
     if not CSV_FILE.exists():
         raise FileNotFoundError(f"CSV file not found: {CSV_FILE}")
 
     api_key, organization = get_api_credentials()
 
-    # Pre-fetch players once to avoid re-listing for every site.
-    token = request_token(api_key, organization)
-    players_cache = fetch_players(token)
-
-    encodings = ("utf-8-sig", "utf-8", "windows-1255", "cp1255", "iso-8859-8", "latin1")
-    rows = iter_csv_rows(CSV_FILE, encodings)
-    header = next(rows)
+    # One token for the whole run, refreshed only on expiry or 401
+    tm = TokenManager(api_key, organization)
 
-    try:
-        site_idx = header.index("מספר אתר/תאור אתר")
-    except ValueError as exc:
-        raise RuntimeError("Column 'מספר אתר/תאור אתר' not found in CSV header.") from exc
-
-    seen_sites: set[str] = set()
-    sites_with_missing: list[str] = []
-
-    for row in rows:
-        if len(row) <= site_idx:
-            continue
-        site_id = row[site_idx].strip()
-        if not site_id or site_id in seen_sites:
-            continue
-        seen_sites.add(site_id)
+    # Pre-fetch players once to avoid re-listing for every site.
+    players_cache = call_with_token(tm, fetch_players)
 
-        if audit_site(site_id, players_cache, api_key, organization):
-            sites_with_missing.append(site_id)
+    site_ids = collect_site_ids(CSV_FILE)
+    sites_with_missing = audit_sites(site_ids, players_cache, tm)
 
     # Write results CSV: one row per site_id with missing attributes.
-    with OUTPUT_FILE.open("w", encoding="utf-8", newline="") as fh:
+    with OUTPUT_FILE.open("w", encoding="utf-8", newline="", buffering=1 << 16) as fh:
         writer = csv.writer(fh)
-        writer.writerow(["מספר אתר/תאור אתר"])
-        for site_id in sites_with_missing:
-            writer.writerow([site_id])
+        writer.writerow([SITE_COLUMN])
+        writer.writerows([site_id] for site_id in sites_with_missing)
 
     print(
         f"\n[INFO] Finished audit. Found {len(sites_with_missing)} site(s) with missing attributes."
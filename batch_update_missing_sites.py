@@ -1,13 +1,13 @@
+from __future__ import annotations
+
 import csv
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Iterable, List, Tuple
-
-import requests
+from typing import Callable, Iterable, List, Optional, Tuple
 
 from update_player_city import (
     CSV_FILE,
     DICT_FILE,
-    API_BASE_URL,
     find_site_city,
     find_site_reseller,
     find_site_isp,
@@ -16,18 +16,21 @@ from update_player_city import (
     translate_reseller,
     translate_isp,
     get_api_credentials,
-    request_token,
+    TokenManager,
+    call_with_token,
     fetch_players,
-    filter_players,
-    fetch_player,
-    patch_player_city,
-    set_player_reseller,
-    set_player_isp,
-    set_player_streaming_flags,
+    annotate_players,
+    build_player_index,
+    process_player,
 )
 
 
 MISSING_SITES_FILE = Path("missing_player_attributes.csv")
+# Sites are independent, so up to this many are processed at the same time
+MAX_SITE_WORKERS = 8
+
+# (city_en, reseller_en, isp_en, group_flags) for a site that can be updated
+SitePlan = Tuple[str, str, str, dict]
 
 
 def load_missing_sites(path: Path) -> List[Tuple[str, str]]:
@@ -61,33 +64,27 @@ def write_missing_sites(path: Path, sites: Iterable[Tuple[str, str]]) -> None:
     """
     Rewrite missing_player_attributes.csv with the remaining site ids and notes.
     """
-    with path.open("w", encoding="utf-8", newline="") as fh:
+    with path.open("w", encoding="utf-8", newline="", buffering=1 << 16) as fh:
         writer = csv.writer(fh)
         writer.writerow(["מספר אתר/תאור אתר", "note"])
-        for site_id, note in sites:
-            writer.writerow([site_id, note])
+        writer.writerows(sites)
 
 
-def process_site(
+def resolve_site(
     site_id: str,
     dictionaries: dict,
-    api_key: str,
-    organization: str,
-    players_cache: list[dict],
-) -> Tuple[bool, str]:
+    target_players: list[dict],
+    out: Callable[[str], None],
+) -> Tuple[Optional[SitePlan], str]:
     """
-    Apply the same logic as update_player_city.main for a single site id.
+    Look up and translate the CSV values for a single site id and work out
+    its LH/PV group flags, the same way update_player_city.main does.
+    target_players are the (annotated) players matching the site id.
 
-    Returns (resolved, note):
-      - resolved=True  -> site was successfully updated, can be removed from CSV.
-      - resolved=False -> keep site in CSV with 'note' explaining why.
+    Returns (plan, note): plan is None when the site cannot be updated,
+    with 'note' explaining why.
     """
-    if not CSV_FILE.exists():
-        raise FileNotFoundError(f"CSV file not found: {CSV_FILE}")
-    if not DICT_FILE.exists():
-        raise FileNotFoundError(f"Dictionaries file not found: {DICT_FILE}")
-
-    print(f"\n=== Processing site {site_id} ===")
+    out(f"\n=== Processing site {site_id} ===")
 
     try:
         city_he = find_site_city(site_id)
@@ -95,8 +92,8 @@ def process_site(
         isp_he = find_site_isp(site_id)
     except Exception as exc:
         msg = f"Failed to read CSV data for site {site_id}: {exc}"
-        print(f"[ERROR] {msg}")
-        return False, msg
+        out(f"[ERROR] {msg}")
+        return None, msg
 
     try:
         city_en = translate_city(city_he, dictionaries)
@@ -106,181 +103,50 @@ def process_site(
         # Dictionary lookup failure (city/reseller/ISP not found) –
         # record it in the CSV note and continue with other sites.
         msg = str(exc)
-        print(f"[ERROR] {msg}")
-        return False, msg
+        out(f"[ERROR] {msg}")
+        return None, msg
 
-    print(
+    out(
         f"Site {site_id}: Hebrew city '{city_he}' -> English '{city_en}', "
         f"reseller '{reseller_he}' -> '{reseller_en}', "
         f"ISP '{isp_he}' -> '{isp_en}'"
     )
 
-    token = request_token(api_key, organization)
-    players = players_cache or fetch_players(token)
-    target_players = filter_players(players, site_id)
-
     if not target_players:
         msg = f"No players found containing '{site_id}'. Nothing to update."
-        print(msg)
-        return False, msg
+        out(msg)
+        return None, msg
 
-    print(f"Found {len(target_players)} player(s) matching site {site_id}.")
+    out(f"Found {len(target_players)} player(s) matching site {site_id}.")
 
     # Determine, within this site/number, whether there are LH-only, PV-only
     # and/or combined (PV_LH/LH_PV) players.
-    any_lh_only = False
-    any_pv_only = False
-    any_combined = False
-    for p in target_players:
-        ident_raw = (p.get("identifier") or p.get("name") or "").strip()
-        ident = ident_raw.upper()
-        has_lh = "LH" in ident
-        has_pv = "PV" in ident
-        is_combined = "PV_LH" in ident or "LH_PV" in ident
-        if is_combined:
-            any_combined = True
-        elif has_lh and not has_pv:
-            any_lh_only = True
-        elif has_pv and not has_lh:
-            any_pv_only = True
+    group_flags = {
+        "any_combined": any(p["_is_combined"] for p in target_players),
+        "any_lh_only": any(p["_is_lh_only"] for p in target_players),
+        "any_pv_only": any(p["_is_pv_only"] for p in target_players),
+    }
+    return (city_en, reseller_en, isp_en, group_flags), ""
 
-    had_error = False
 
-    for player in target_players:
-        player_id = player.get("playerId") or player.get("id")
-        identifier = (player.get("identifier") or player.get("name", "")).strip()
-        if player_id is None:
-            print(f"Skipping player without id: {identifier}")
-            continue
-
-        try:
-            print(f"\nProcessing player {identifier} (id {player_id})")
-            token = request_token(api_key, organization)  # fresh token per player
-            current = fetch_player(token, int(player_id))
-
-            # Current city
-            current_city = (current.get("coordinates") or {}).get("city")
-
-            # Current reseller from variables list (name == "M4DS_Reseller")
-            vars_raw = current.get("variables") or []
-            if isinstance(vars_raw, dict):
-                vars_list = [vars_raw]
-            elif isinstance(vars_raw, list):
-                vars_list = vars_raw
-            else:
-                vars_list = []
-
-            current_reseller = None
-            current_isp = None
-            current_stream_hot = None
-            current_stream_triple = None
-            current_stream_vert_hot = None
-            current_stream_vert_triple = None
-            reseller_index: int | None = None
-            for idx, item in enumerate(vars_list):
-                if not isinstance(item, dict):
-                    continue
-                if item.get("name") == "M4DS_Reseller":
-                    reseller_index = idx
-                    current_reseller = item.get("value")
-                if item.get("name") == "M4DS_ISP":
-                    current_isp = item.get("value")
-                if item.get("name") == "M4DS_StreamingHot_Muted":
-                    current_stream_hot = item.get("value")
-                if item.get("name") == "M4DS_StreamingTriple_Muted":
-                    current_stream_triple = item.get("value")
-                if item.get("name") == "M4DS_StreamingVerticalHot_Muted":
-                    current_stream_vert_hot = item.get("value")
-                if item.get("name") == "M4DS_StreamingVerticalTriple_Muted":
-                    current_stream_vert_triple = item.get("value")
-
-            print(f"  Current city: {current_city!
-            r}")
-            print(f"  Current reseller: {current_reseller!r}")
-            print(f"  Current ISP: {current_isp!r}")
-            print(f"  Current StreamingHot_Muted: {current_stream_hot!r}")
-            print(f"  Current StreamingTriple_Muted: {current_stream_triple!r}")
-            print(f"  Current StreamingVerticalHot_Muted: {current_stream_vert_hot!r}")
-            print(f"  Current StreamingVerticalTriple_Muted: {current_stream_vert_triple!r}")
-
-            # Patch city
-            patch_player_city(token, int(player_id), city_en)
-
-            # Set reseller and ISP via POST /v1/players/{id}/variables
-            token = request_token(api_key, organization)
-            set_player_reseller(token, int(player_id), reseller_en)
-            token = request_token(api_key, organization)
-            set_player_isp(token, int(player_id), isp_en)
-
-            # Set streaming-muted flags based on identifier and group rules
-            ident_upper = identifier.upper()
-            has_lh = "LH" in ident_upper
-            has_pv = "PV" in ident_upper
-            is_combined = "PV_LH" in ident_upper or "LH_PV" in ident_upper
-            is_lh_only = has_lh and not has_pv and not is_combined
-            is_pv_only = has_pv and not has_lh and not is_combined
-
-            token = request_token(api_key, organization)
-            set_player_streaming_flags(
-                token,
-                int(player_id),
-                identifier,
-                any_combined=any_combined,
-                any_lh_only=any_lh_only,
-                any_pv_only=any_pv_only,
-                is_combined=is_combined,
-                is_lh_only=is_lh_only,
-                is_pv_only=is_pv_only,
-            )
-
-            # Fetch updated player and show new values
-            token = request_token(api_key, organization)
-            updated = fetch_player(token, int(player_id))
-
-            new_city = (updated.get("coordinates") or {}).get("city")
-
-            updated_vars_raw = updated.get("variables") or []
-            if isinstance(updated_vars_raw, dict):
-                updated_vars_list = [updated_vars_raw]
-            elif isinstance(updated_vars_raw, list):
-                updated_vars_list = updated_vars_raw
-            else:
-                updated_vars_list = []
-
-            new_reseller = None
-            new_isp = None
-            new_stream_hot = None
-            new_stream_triple = None
-            new_stream_vert_hot = None
-            new_stream_vert_triple = None
-            for item in updated_vars_list:
-                if not isinstance(item, dict):
-                    continue
-                if item.get("name") == "M4DS_Reseller":
-                    new_reseller = item.get("value")
-                if item.get("name") == "M4DS_ISP":
-                    new_isp = item.get("value")
-                if item.get("name") == "M4DS_StreamingHot_Muted":
-                    new_stream_hot = item.get("value")
-                if item.get("name") == "M4DS_StreamingTriple_Muted":
-                    new_stream_triple = item.get("value")
-                if item.get("name") == "M4DS_StreamingVerticalHot_Muted":
-                    new_stream_vert_hot = item.get("value")
-                if item.get("name") == "M4DS_StreamingVerticalTriple_Muted":
-                    new_stream_vert_triple = item.get("value")
-
-            print(f"  Updated city: {new_city!r}")
-            print(f"  Updated reseller: {new_reseller!r}")
-            print(f"  Updated ISP: {new_isp!r}")
-            print(f"  Updated StreamingHot_Muted: {new_stream_hot!r}")
-            print(f"  Updated StreamingTriple_Muted: {new_stream_triple!r}")
-            print(f"  Updated StreamingVerticalHot_Muted: {new_stream_vert_hot!r}")
-            print(f"  Updated StreamingVerticalTriple_Muted: {new_stream_vert_triple!r}")
-        except requests.HTTPError as exc:
-            print(f"  [ERROR] API call failed: {exc}")
-            had_error = True
-        except Exception as exc:
-            print(f"  [ERROR] Unexpected error: {exc}")
+def process_site(
+    plan: SitePlan,
+    tm: TokenManager,
+    players: list[dict],
+    out: Callable[[str], None],
+) -> Tuple[bool, str]:
+    """
+    Update the given players of one site with its resolved values (this
+    script does not set the sector).
+
+    Returns (resolved, note):
+      - resolved=True  -> site was successfully updated, can be removed from CSV.
+      - resolved=False -> keep site in CSV with 'note' explaining why.
+    """
+    city_en, reseller_en, isp_en, group_flags = plan
+    had_error = False
+    for player in players:
+        if not process_player(player, tm, city_en, reseller_en, isp_en, "", group_flags, out):
             had_error = True
 
     if had_error:
@@ -293,28 +159,76 @@ def main() -> None:
     if not MISSING_SITES_FILE.exists():
         raise FileNotFoundError(f"Missing sites file not found: {MISSING_SITES_FILE}")
 
+    if not CSV_FILE.exists():
+        raise FileNotFoundError(f"CSV file not found: {CSV_FILE}")
+    if not DICT_FILE.exists():
+        raise FileNotFoundError(f"Dictionaries file not found: {DICT_FILE}")
+
     original_sites = load_missing_sites(MISSING_SITES_FILE)
     dictionaries = load_dictionaries()
     api_key, organization = get_api_credentials()
 
-    # Pre-fetch players once
-    token = request_token(api_key, organization)
-    players_cache = fetch_players(token)
+    # One token for the whole run, refreshed only on 401
+    tm = TokenManager(api_key, organization)
+
+    # Pre-fetch players once and classify their identifiers (LH/PV) once
+    players_cache = call_with_token(tm, fetch_players)
+    annotate_players(players_cache)
+
+    # Match all players to all sites once instead of scanning players per site
+    player_index = build_player_index(players_cache, [site_id for site_id, _ in original_sites])
+
+    # Resolve every site's values first; each site's report is kept in its
+    # own buffer and printed in file order
+    site_lines: dict[str, list[str]] = {site_id: [] for site_id, _ in original_sites}
+    plans: dict[str, SitePlan] = {}
+    notes: dict[str, str] = {}
+    for site_id, _ in original_sites:
+        plan, note = resolve_site(
+            site_id, dictionaries, player_index.get(site_id, []), site_lines[site_id].append
+        )
+        if plan is None:
+            notes[site_id] = note
+        else:
+            plans[site_id] = plan
+
+    # A player matching several sites is written once, with the values of the
+    # last such site in file order (the one that won when sites ran in turn)
+    owner: dict[int, str] = {}
+    for site_id in plans:
+        for player in player_index[site_id]:
+            owner[id(player)] = site_id
+
+    def run_site(site_id: str) -> Tuple[bool, str]:
+        out = site_lines[site_id].append
+        players = []
+        for player in player_index[site_id]:
+            if owner[id(player)] == site_id:
+                players.append(player)
+            else:
+                identifier = (player.get("identifier") or player.get("name") or "").strip()
+                out(f"\nPlayer {identifier} also matches site {owner[id(player)]}; updated there")
+        return process_site(plans[site_id], tm, players, out)
 
     # Process all sites from the CSV
     remaining_sites: List[Tuple[str, str]] = []
 
-    for site_id, existing_note in original_sites:
-        resolved, note = process_site(
-            site_id, dictionaries, api_key, organization, players_cache
-        )
-        if resolved:
-            # Successfully updated – remove from CSV (do not add to remaining_sites)
-            continue
+    with ThreadPoolExecutor(max_workers=MAX_SITE_WORKERS) as executor:
+        outcomes = executor.map(run_site, list(plans))
+        for site_id, existing_note in original_sites:
+            if site_id in plans:
+                resolved, note = next(outcomes)
+            else:
+                resolved, note = False, notes[site_id]
+            print("\n".join(site_lines.pop(site_id)), flush=True)
+
+            if resolved:
+                # Successfully updated – remove from CSV (do not add to remaining_sites)
+                continue
 
-        # Keep site with updated note (dictionary errors, no players, or per-player errors)
-        final_note = note or existing_note
-        remaining_sites.append((site_id, final_note))
+            # Keep site with updated note (dictionary errors, no players, or per-player errors)
+            final_note = note or existing_note
+            remaining_sites.append((site_id, final_note))
 
     write_missing_sites(MISSING_SITES_FILE, remaining_sites)
 
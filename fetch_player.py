@@ -6,17 +6,27 @@ Usage: py fetch_player.py
 import os
 import sys
 import json
-import time
 import requests
 from pathlib import Path
+from requests.adapters import HTTPAdapter
+
+from update_player_city import pause_before_exit
 
 API_BASE_URL = "https://m4d-srv.ctv.co.il/media4display-api"
 
+# M4D_VERBOSE=1 (or true/yes) also prints the request URL, response status, headers and raw body
+VERBOSE = os.environ.get("M4D_VERBOSE", "").strip().lower() in ("1", "true", "yes")
+
+# One pooled keep-alive session for all API calls (avoids a TLS handshake per call)
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=32))
+SESSION.headers.update({"Accept": "application/json"})
+
 
 def request_token(api_key: str, organization: str) -> str:
     """Get authentication token from the API."""
     print("[INFO] Requesting authentication token...")
-    resp = requests.post(
+    resp = SESSION.post(
         f"{API_BASE_URL}/v1/token",
         json={"apiKey": api_key, "organization": organization},
         timeout=30,
@@ -30,43 +40,42 @@ def request_token(api_key: str, organization: str) -> str:
 def fetch_player(token: str, player_id: int) -> dict:
     """Fetch detailed information for a specific player."""
     print(f"[INFO] Fetching player {player_id}...")
-    print(f"[INFO] URL: {API_BASE_URL}/v1/players/{player_id}")
-    
-    resp = requests.get(
+    if VERBOSE:
+        print(f"[INFO] URL: {API_BASE_URL}/v1/players/{player_id}")
+
+    resp = SESSION.get(
         f"{API_BASE_URL}/v1/players/{player_id}",
         headers={"Authorization": f"Bearer {token}"},
         timeout=60,
     )
-    
-    # Display response details
-    print(f"\n[INFO] Response Status Code: {resp.status_code}")
-    print(f"[INFO] Response Headers:")
-    for key, value in resp.headers.items():
-        print(f"  {key}: {value}")
-    
-    # Display response body (raw text)
-    print(f"\n[INFO] Raw Response Body:")
-    print(f"{'='*60}")
-    print(resp.text)
-    print(f"{'='*60}")
-    
-    # Check for errors first, but don't raise yet - we want to see the response
+
+    # Response details are only printed with M4D_VERBOSE=1
+    if VERBOSE:
+        print(f"\n[INFO] Response Status Code: {resp.status_code}")
+        print(f"[INFO] Response Headers:")
+        for key, value in resp.headers.items():
+            print(f"  {key}: {value}")
+        print(f"\n[INFO] Raw Response Body:")
+        print(f"{'='*60}")
+        print(resp.text)
+        print(f"{'='*60}")
+
     if resp.status_code >= 400:
         print(f"\n[WARN] HTTP Error Status Code: {resp.status_code}")
-    
+
     # Try to parse JSON if possible
     try:
         player_data = resp.json()
-        print(f"\n[INFO] Successfully parsed JSON response")
+        if VERBOSE:
+            print(f"\n[INFO] Successfully parsed JSON response")
         player_data["_status_code"] = resp.status_code  # Include status code in response
         return player_data
     except json.JSONDecodeError as e:
         print(f"\n[WARN] Could not parse response as JSON: {e}")
+        if not VERBOSE:
+            print(f"[WARN] Raw Response Body:\n{resp.text}")
         print(f"[INFO] Returning raw text instead")
         return {"raw_response": resp.text, "status_code": resp.status_code}
-    
-    # Now raise for status if there was an error (after we've displayed everything)
-    resp.raise_for_status()
 
 
 def main():
@@ -198,10 +207,6 @@ if __name__ == "__main__":
         print("\n\n[INFO] Interrupted by user")
         exit_code = 1
     finally:
-        try:
-            print("\n[INFO] Exiting in 15 seconds...")
-            time.sleep(15)
-        except KeyboardInterrupt:
-            pass
+        pause_before_exit(15, prefix="[INFO] ")
     sys.exit(exit_code)
 
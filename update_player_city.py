@@ -1,18 +1,86 @@
+from __future__ import annotations
+
+import base64
+import codecs
 import csv
+import io
 import json
 import os
 import sys
+import threading
 import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import product
 from pathlib import Path
-from typing import Iterable, Tuple
+from types import MappingProxyType
+from typing import Callable, Iterable, Mapping, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import keyring
+except ImportError:  # optional: without it the API key is prompted every run
+    keyring = None
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib json parser
+    orjson = None
 
 
 CSV_FILE = Path("_1ec01f0כרטיס מכשיר(DataSheet).csv")
 DICT_FILE = Path("dictionaries.json")
+# Encodings tried in order on the whole CSV; latin1 always succeeds
+CSV_ENCODINGS = ("utf-8-sig", "windows-1255", "iso-8859-8", "latin1")
+# M4D_CSV_ENCODING=<codec> makes decode_csv_bytes use that encoding and skip detection
+CSV_ENCODING = os.environ.get("M4D_CSV_ENCODING") or None
 API_BASE_URL = "https://m4d-srv.ctv.co.il/media4display-api"
 
+# One pooled keep-alive session for all API calls (avoids a TLS handshake per call).
+# Transient errors on idempotent requests (GET) are retried with backoff.
+SESSION = requests.Session()
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_maxsize=32,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=(429, 500, 502, 503, 504),
+            raise_on_status=False,  # hand the last response to raise_for_status as before
+        ),
+    ),
+)
+KEYRING_SERVICE = "m4d"
+# M4D_VERBOSE=1 (or true/yes) fetches each player before and after the update
+# to print its values, and prints the streaming-flag decisions and request bodies
+VERBOSE = os.environ.get("M4D_VERBOSE", "").strip().lower() in ("1", "true", "yes")
+# Players updated concurrently; each player's calls stay in order
+MAX_PLAYER_WORKERS = 8
+# Reuse a token for this long before requesting a new one proactively
+TOKEN_TTL_SECONDS = 50 * 60
+# Refresh this long before a JWT token's own "exp"
+TOKEN_EXPIRY_MARGIN_SECONDS = 60
+# Never plan a refresh sooner than this, however short the JWT lifetime looks
+TOKEN_MIN_LIFETIME_SECONDS = 5
+
+# Per-site CSV values, filled once by load_csv_once
+_CSV_CACHE: dict[str, dict[str, str]] | None = None
+# Per-site non-empty sectors in file order (None if the column is missing)
+_CSV_SECTORS: dict[str, list[str]] | None = None
+_CSV_LOCK = threading.Lock()
+# Shared read-only stand-in for a missing nested object
+_EMPTY: Mapping = MappingProxyType({})
+# NBSP -> space, applied by normalize_text to CSV cells and dictionary keys
+_NBSP_TABLE = str.maketrans("\u00a0", " ")
+# Keeps each player's report in one block when players run in parallel
+_PRINT_LOCK = threading.Lock()
+# API key typed at the prompt this run; saved to the keyring once the API accepts it
+_PROMPTED_API_KEY: str | None = None
+
 
 def prompt_site_id() -> str:
     site_id = input("Enter site number (without computer number or ISP - like 200010 IPS): ").strip()
@@ -21,86 +89,183 @@ def prompt_site_id() -> str:
     return site_id
 
 
-def iter_csv_rows(path: Path, encodings: Iterable[str]) -> Iterable[list[str]]:
+def decode_csv_bytes(raw: bytes, encodings: Iterable[str] = CSV_ENCODINGS) -> str:
+    """
+    Decode the whole CSV file with the first encoding that succeeds
+    (utf-8-sig also reads BOM-less UTF-8). A UTF-16 BOM decides directly,
+    and M4D_CSV_ENCODING, when set, is used as-is instead of either.
+    """
+    if CSV_ENCODING:
+        try:
+            return raw.decode(CSV_ENCODING)
+        except (UnicodeDecodeError, LookupError) as exc:
+            raise RuntimeError(f"Unable to decode CSV file as M4D_CSV_ENCODING={CSV_ENCODING}: {exc}") from None
+    if raw.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return raw.decode("utf-16")
     for encoding in encodings:
         try:
-            with path.open("r", encoding=encoding, newline="") as fh:
-                reader = csv.reader(fh)
-                header = next(reader, None)
-                if header is None:
-                    continue
-                yield header
-                for row in reader:
-                    yield row
-                return
-        except Exception:
+            return raw.decode(encoding)
+        except UnicodeDecodeError:
             continue
-    raise RuntimeError(f"Unable to read CSV file {path} with provided encodings.")
+    raise RuntimeError("Unable to decode CSV file with provided encodings.")
 
 
-def find_site_city(site_id: str) -> str:
+def normalize_text(value: str) -> str:
+    """Replace non-breaking spaces with spaces and strip surrounding whitespace."""
+    # Most cells have no NBSP; skip the translate copy for them
+    if "\u00a0" in value:
+        value = value.translate(_NBSP_TABLE)
+    return value.strip()
+
+
+def iter_csv_rows(path: Path) -> Iterable[list[str]]:
+    """Read the CSV file in one go, decode it once and yield its rows."""
+    try:
+        text = decode_csv_bytes(path.read_bytes())
+    except RuntimeError as exc:
+        raise RuntimeError(f"Unable to read CSV file {path}.") from exc
+    yield from csv.reader(io.StringIO(text, newline=""))
+
+
+def column_positions(header: list[str]) -> dict[str, int]:
+    """Map each header name to its first column index in a single pass (like list.index)."""
+    positions: dict[str, int] = {}
+    for idx, name in enumerate(header):
+        positions.setdefault(name, idx)
+    return positions
+
+
+def parse_csv_index() -> tuple[dict[str, dict[str, str]], dict[str, list[str]] | None]:
     """
-    Look up 'עיר האתר' (city) for the given site id in the CSV.
-    If multiple rows exist for the site, returns the first one with non-empty city.
+    Parse the CSV once and return, per site id, the first non-empty city,
+    reseller and ISP (NBSP-normalized and stripped), plus every non-empty
+    sector in file order (None if the sector column is missing).
     """
-    encodings = ("utf-8-sig", "utf-8", "windows-1255", "cp1255", "iso-8859-8", "latin1")
-    rows = iter_csv_rows(CSV_FILE, encodings)
-    header = next(rows)
+    rows = iter_csv_rows(CSV_FILE)
+    header = next(rows, None)
+    if header is None:
+        raise RuntimeError(f"CSV file {CSV_FILE} is empty.")
 
+    positions = column_positions(header)
     try:
-        site_idx = header.index("מספר אתר/תאור אתר")
-        city_idx = header.index("עיר האתר")
-    except ValueError as exc:
+        site_idx = positions["מספר אתר/תאור אתר"]
+        columns = {
+            "city": positions["עיר האתר"],
+            "reseller": positions["תאור משווק"],
+            "isp": positions["ספק תקשורת"],
+        }
+    except KeyError as exc:
         raise RuntimeError("Expected columns not found in CSV header.") from exc
+    sector_idx = positions.get("סוג תוכן")
 
-    # Check all rows for this site and use the first one with non-empty city
+    cache: dict[str, dict[str, str]] = {}
+    sectors: dict[str, list[str]] = defaultdict(list)
     for row in rows:
-        if len(row) <= max(site_idx, city_idx):
+        if len(row) <= site_idx:
             continue
-        if row[site_idx] == site_id:
-            city = row[city_idx].replace("\u00a0", " ").strip()
-            if city:  # Found a row with non-empty city, return it
-                return city
+        site = cache.setdefault(row[site_idx], {})
+        if sector_idx is not None and len(row) > sector_idx:
+            sector = sys.intern(normalize_text(row[sector_idx]))
+            if sector:
+                sectors[row[site_idx]].append(sector)
+        for field, idx in columns.items():
+            if field in site or len(row) <= idx:
+                continue
+            value = sys.intern(normalize_text(row[idx]))
+            if value:  # Keep the first row with a non-empty value
+                site[field] = value
+
+    return cache, (dict(sectors) if sector_idx is not None else None)
+
+
+def load_csv_once() -> dict[str, dict[str, str]]:
+    """
+    Read the CSV a single time per run and cache, per site id, the first
+    non-empty city, reseller and ISP (NBSP-normalized and stripped), so the
+    find_site_* lookups no longer re-open and re-scan the file. Every
+    non-empty sector is kept too, since find_site_sector prefers the first
+    one found in sector_dictionary.
+    """
+    global _CSV_CACHE, _CSV_SECTORS
+    with _CSV_LOCK:
+        if _CSV_CACHE is None:
+            _CSV_CACHE, _CSV_SECTORS = parse_csv_index()
+        return _CSV_CACHE
+
 
-    raise RuntimeError(f"Site id {site_id} not found in CSV or all rows have empty city.")
+def find_site_city(site_id: str) -> str:
+    """
+    Look up 'עיר האתר' (city) for the given site id in the CSV.
+    If multiple rows exist for the site, returns the first one with non-empty city.
+    """
+    city = load_csv_once().get(site_id, {}).get("city")
+    if not city:
+        raise RuntimeError(f"Site id {site_id} not found in CSV or all rows have empty city.")
+    return city
+
+
+def normalize_dictionary(d: dict) -> dict[str, str]:
+    """
+    Return {normalized Hebrew key: English value} with NBSP replaced and
+    whitespace stripped. On duplicate normalized keys the first one wins,
+    like the original linear scan. Keys are interned, as are the CSV values
+    looked up in them, so equal strings are one shared object and a hit
+    usually matches on identity before any character comparison.
+    """
+    normalized: dict[str, str] = {}
+    for key, value in d.items():
+        normalized.setdefault(sys.intern(normalize_text(key)), value)
+    return normalized
 
 
 def load_dictionaries() -> dict:
-    with DICT_FILE.open("r", encoding="utf-8") as fh:
-        return json.load(fh)
+    """
+    Load dictionaries.json and add a "_normalized" entry holding a
+    pre-normalized copy of each dictionary for direct lookups.
+    """
+    dictionaries = parse_json(DICT_FILE.read_bytes())
+    dictionaries["_normalized"] = {
+        name: normalize_dictionary(d) for name, d in dictionaries.items() if isinstance(d, dict)
+    }
+    return dictionaries
+
+
+def normalized_dictionary(dictionaries: dict, name: str) -> dict[str, str]:
+    """Return the pre-normalized dictionary, building it if it was not loaded via load_dictionaries."""
+    normalized = dictionaries.get("_normalized", {}).get(name)
+    if normalized is None:
+        normalized = normalize_dictionary(dictionaries.get(name, {}))
+    return normalized
 
 
 def translate_city(city_he: str, dictionaries: dict) -> str:
     """
     Translate Hebrew city name to English code using cities_dictionary.
     """
-    cities = dictionaries.get("cities_dictionary", {})
-    for key, value in cities.items():
-        if key.replace("\u00a0", " ").strip() == city_he:
-            return value
-    raise RuntimeError(f"City '{city_he}' not found in cities_dictionary.")
+    try:
+        return normalized_dictionary(dictionaries, "cities_dictionary")[city_he]
+    except KeyError:
+        raise RuntimeError(f"City '{city_he}' not found in cities_dictionary.") from None
 
 
 def translate_reseller(reseller_he: str, dictionaries: dict) -> str:
     """
     Translate Hebrew reseller name to English code using reseller_dictionary.
     """
-    resellers = dictionaries.get("reseller_dictionary", {})
-    for key, value in resellers.items():
-        if key.replace("\u00a0", " ").strip() == reseller_he:
-            return value
-    raise RuntimeError(f"Reseller '{reseller_he}' not found in reseller_dictionary.")
+    try:
+        return normalized_dictionary(dictionaries, "reseller_dictionary")[reseller_he]
+    except KeyError:
+        raise RuntimeError(f"Reseller '{reseller_he}' not found in reseller_dictionary.") from None
 
 
 def translate_isp(isp_he: str, dictionaries: dict) -> str:
     """
     Translate Hebrew ISP name to English code using ISP_dictionary.
     """
-    isps = dictionaries.get("ISP_dictionary", {})
-    for key, value in isps.items():
-        if key.replace("\u00a0", " ").strip() == isp_he:
-            return value
-    raise RuntimeError(f"ISP '{isp_he}' not found in ISP_dictionary.")
+    try:
+        return normalized_dictionary(dictionaries, "ISP_dictionary")[isp_he]
+    except KeyError:
+        raise RuntimeError(f"ISP '{isp_he}' not found in ISP_dictionary.") from None
 
 
 def find_site_sector(site_id: str, dictionaries: dict) -> str:
@@ -109,44 +274,18 @@ def find_site_sector(site_id: str, dictionaries: dict) -> str:
     If multiple rows exist for the site, prioritizes values that exist in sector_dictionary.
     Returns the first sector value that matches the dictionary, otherwise returns the first non-empty value.
     """
-    encodings = ("utf-8-sig", "utf-8", "windows-1255", "cp1255", "iso-8859-8", "latin1")
-    rows = iter_csv_rows(CSV_FILE, encodings)
-    header = next(rows)
+    load_csv_once()
+    if _CSV_SECTORS is None:
+        raise RuntimeError("Expected columns not found in CSV header.")
+    sectors_found = _CSV_SECTORS.get(site_id)
+    if not sectors_found:
+        raise RuntimeError(f"Site id {site_id} not found in CSV or all rows have empty sector.")
 
-    try:
-        site_idx = header.index("מספר אתר/תאור אתר")
-        sector_idx = header.index("סוג תוכן")
-    except ValueError as exc:
-        raise RuntimeError("Expected columns not found in CSV header.") from exc
-
-    sector_dictionary = dictionaries.get("sector_dictionary", {})
-    sector_keys = set(key.replace("\u00a0", " ").strip() for key in sector_dictionary.keys())
-    
-    sectors_found = []
-    dictionary_match = None
-    
-    # Check all rows for this site
-    for row in rows:
-        if len(row) <= max(site_idx, sector_idx):
-            continue
-        if row[site_idx] == site_id:
-            sector = row[sector_idx].replace("\u00a0", " ").strip()
-            if sector:
-                sectors_found.append(sector)
-                # Check if this sector is in the dictionary
-                if sector in sector_keys:
-                    dictionary_match = sector
-                    break  # Found a dictionary match, use it
-    
-    # If we found a dictionary match, return it
-    if dictionary_match:
-        return dictionary_match
-    
-    # Otherwise, return the first non-empty sector found
-    if sectors_found:
-        return sectors_found[0]
-    
-    raise RuntimeError(f"Site id {site_id} not found in CSV or all rows have empty sector.")
+    sector_keys = normalized_dictionary(dictionaries, "sector_dictionary")
+    for sector in sectors_found:
+        if sector in sector_keys:
+            return sector
+    return sectors_found[0]
 
 
 def translate_sector(sector_he: str, dictionaries: dict) -> str:
@@ -154,12 +293,7 @@ def translate_sector(sector_he: str, dictionaries: dict) -> str:
     Translate Hebrew sector/content type to English code using sector_dictionary.
     If not found in dictionary, returns "GENERAL".
     """
-    sectors = dictionaries.get("sector_dictionary", {})
-    for key, value in sectors.items():
-        if key.replace("\u00a0", " ").strip() == sector_he:
-            return value
-    # If not found in dictionary, return "GENERAL"
-    return "GENERAL"
+    return normalized_dictionary(dictionaries, "sector_dictionary").get(sector_he, "GENERAL")
 
 
 def find_site_reseller(site_id: str) -> str:
@@ -167,26 +301,10 @@ def find_site_reseller(site_id: str) -> str:
     Look up 'תאור משווק' (reseller description) for the given site id in the CSV.
     If multiple rows exist for the site, returns the first one with non-empty reseller.
     """
-    encodings = ("utf-8-sig", "utf-8", "windows-1255", "cp1255", "iso-8859-8", "latin1")
-    rows = iter_csv_rows(CSV_FILE, encodings)
-    header = next(rows)
-
-    try:
-        site_idx = header.index("מספר אתר/תאור אתר")
-        reseller_idx = header.index("תאור משווק")
-    except ValueError as exc:
-        raise RuntimeError("Expected columns not found in CSV header.") from exc
-
-    # Check all rows for this site and use the first one with non-empty reseller
-    for row in rows:
-        if len(row) <= max(site_idx, reseller_idx):
-            continue
-        if row[site_idx] == site_id:
-            reseller = row[reseller_idx].replace("\u00a0", " ").strip()
-            if reseller:  # Found a row with non-empty reseller, return it
-                return reseller
-
-    raise RuntimeError(f"Site id {site_id} not found in CSV or all rows have empty reseller.")
+    reseller = load_csv_once().get(site_id, {}).get("reseller")
+    if not reseller:
+        raise RuntimeError(f"Site id {site_id} not found in CSV or all rows have empty reseller.")
+    return reseller
 
 
 def find_site_isp(site_id: str) -> str:
@@ -194,48 +312,72 @@ def find_site_isp(site_id: str) -> str:
     Look up 'ספק תקשורת' (ISP) for the given site id in the CSV.
     If multiple rows exist for the site, returns the first one with non-empty ISP.
     """
-    encodings = ("utf-8-sig", "utf-8", "windows-1255", "cp1255", "iso-8859-8", "latin1")
-    rows = iter_csv_rows(CSV_FILE, encodings)
-    header = next(rows)
-
-    try:
-        site_idx = header.index("מספר אתר/תאור אתר")
-        isp_idx = header.index("ספק תקשורת")
-    except ValueError as exc:
-        raise RuntimeError("Expected columns not found in CSV header.") from exc
-
-    # Check all rows for this site and use the first one with non-empty ISP
-    for row in rows:
-        if len(row) <= max(site_idx, isp_idx):
-            continue
-        if row[site_idx] == site_id:
-            isp = row[isp_idx].replace("\u00a0", " ").strip()
-            if isp:  # Found a row with non-empty ISP, return it
-                return isp
-
-    raise RuntimeError(f"Site id {site_id} not found in CSV or all rows have empty ISP.")
+    isp = load_csv_once().get(site_id, {}).get("isp")
+    if not isp:
+        raise RuntimeError(f"Site id {site_id} not found in CSV or all rows have empty ISP.")
+    return isp
 
 
 def get_api_credentials() -> Tuple[str, str]:
     """
-    Prompt the user for the API key (instead of using a hardcoded value or env var)
-    and obtain the organization (from env if available, otherwise via prompt).
+    Get the API key from M4D_API_KEY, then from the system keyring, and only
+    prompt for it as a last resort (a prompted key is saved to the keyring
+    once the API accepts it, so later runs need no input). The organization
+    comes from M4D_ORG if set, otherwise via prompt.
     """
-    api_key = input("Enter API key: ").strip()
+    global _PROMPTED_API_KEY
+    api_key = os.environ.get("M4D_API_KEY", "").strip()
+    if not api_key and keyring is not None:
+        try:
+            api_key = (keyring.get_password(KEYRING_SERVICE, "api_key") or "").strip()
+        except Exception:
+            api_key = ""
     if not api_key:
-        raise RuntimeError("API key is required.")
-
-    organization = os.environ.get("M4D_ORG")
+        try:
+            api_key = input("Enter API key: ").strip()
+        except EOFError:
+            raise RuntimeError("API key is required (set M4D_API_KEY for non-interactive runs).") from None
+        if not api_key:
+            raise RuntimeError("API key is required.")
+        _PROMPTED_API_KEY = api_key
+
+    organization = os.environ.get("M4D_ORG", "").strip()
     if not organization:
-        organization = input("Enter organization: ").strip()
+        try:
+            organization = input("Enter organization: ").strip()
+        except EOFError:
+            raise RuntimeError("Organization is required (set M4D_ORG for non-interactive runs).") from None
     if not organization:
         raise RuntimeError("Organization is required.")
 
     return api_key, organization
 
 
+def remember_api_key(api_key: str) -> None:
+    """Save a prompted API key to the keyring after the API has accepted it."""
+    global _PROMPTED_API_KEY
+    if keyring is None or api_key != _PROMPTED_API_KEY:
+        return
+    _PROMPTED_API_KEY = None  # saved once; later token refreshes skip this
+    try:
+        keyring.set_password(KEYRING_SERVICE, "api_key", api_key)
+    except Exception:
+        pass
+
+
+def forget_api_key(api_key: str) -> None:
+    """Drop a rejected API key from the keyring so the next run prompts again."""
+    if keyring is None:
+        return
+    try:
+        if keyring.get_password(KEYRING_SERVICE, "api_key") == api_key:
+            keyring.delete_password(KEYRING_SERVICE, "api_key")
+    except Exception:
+        pass
+
+
 def request_token(api_key: str, organization: str) -> str:
-    resp = requests.post(
+    resp = SESSION.post(
         f"{API_BASE_URL}/v1/token",
         json={"apiKey": api_key, "organization": organization},
         timeout=30,
@@ -244,150 +386,237 @@ def request_token(api_key: str, organization: str) -> str:
     return resp.text.strip('"')
 
 
+def token_expires_in(token: str) -> float | None:
+    """
+    Seconds until the token's JWT "exp" claim, or None if the token is not
+    a JWT or carries no expiry.
+    """
+    parts = token.split(".")
+    if len(parts) != 3:
+        return None
+    try:
+        payload = parts[1] + "=" * (-len(parts[1]) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload))["exp"]
+        return float(exp) - time.time()
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+class TokenManager:
+    """
+    Keep one API token for the whole run instead of requesting a new one
+    before every call. A new token is only requested once the cached one
+    expires (its JWT "exp" less a safety margin but at least half its
+    remaining lifetime, at most TOKEN_TTL_SECONDS)
+    or when a caller reports it as stale (e.g. after the API answered 401).
+    A key the token endpoint rejects with 401 is removed from the keyring.
+    """
+
+    def __init__(self, api_key: str, organization: str) -> None:
+        self.api_key = api_key
+        self.organization = organization
+        self.token: str | None = None
+        self.expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, stale_token: str | None = None) -> str:
+        """
+        Return the cached token, refreshing it if expired or if it is still
+        stale_token. Workers that hit a 401 together thus share one refresh.
+        """
+        with self._lock:
+            if (
+                self.token is None
+                or time.monotonic() >= self.expires_at
+                or self.token == stale_token
+            ):
+                try:
+                    self.token = request_token(self.api_key, self.organization)
+                except requests.HTTPError as exc:
+                    if exc.response is not None and exc.response.status_code == 401:
+                        forget_api_key(self.api_key)
+                    raise
+                remember_api_key(self.api_key)
+                lifetime = float(TOKEN_TTL_SECONDS)
+                remaining = token_expires_in(self.token)
+                # An "exp" already past by the local clock (skew) is unusable:
+                # keep the TTL and rely on the 401 refresh instead
+                if remaining is not None and remaining > 0:
+                    # A short-lived token keeps at least half its lifetime
+                    lifetime = min(
+                        lifetime,
+                        max(
+                            remaining - TOKEN_EXPIRY_MARGIN_SECONDS,
+                            remaining / 2,
+                            TOKEN_MIN_LIFETIME_SECONDS,
+                        ),
+                    )
+                self.expires_at = time.monotonic() + lifetime
+            return self.token
+
+
+def call_with_token(tm: TokenManager, func, *args, **kwargs):
+    """
+    Call func(token, *args, **kwargs) with the cached token.
+    If the API answers 401, refresh the token once and retry.
+    """
+    token = tm.get()
+    try:
+        return func(token, *args, **kwargs)
+    except requests.HTTPError as exc:
+        if exc.response is None or exc.response.status_code != 401:
+            raise
+        return func(tm.get(stale_token=token), *args, **kwargs)
+
+
+def parse_json(content: bytes):
+    """Parse a JSON response body, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def dump_json(obj) -> bytes:
+    """Serialize a request body to UTF-8 JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
 def fetch_players(token: str) -> list[dict]:
-    resp = requests.get(
+    resp = SESSION.get(
         f"{API_BASE_URL}/v1/players",
         headers={"Authorization": f"Bearer {token}"},
         timeout=60,
     )
     resp.raise_for_status()
-    return resp.json()
+    return parse_json(resp.content)
+
+
+def annotate_players(players: Iterable[dict]) -> None:
+    """
+    Classify each player's identifier once and store the result on the player:
+      _is_combined  - contains PV_LH or LH_PV
+      _is_lh_only   - contains LH but not PV
+      _is_pv_only   - contains PV but not LH
+    """
+    for player in players:
+        ident = (player.get("identifier") or player.get("name") or "").strip().upper()
+        has_lh = "LH" in ident
+        has_pv = "PV" in ident
+        is_combined = "PV_LH" in ident or "LH_PV" in ident
+        player["_is_combined"] = is_combined
+        player["_is_lh_only"] = has_lh and not has_pv and not is_combined
+        player["_is_pv_only"] = has_pv and not has_lh and not is_combined
 
 
 def filter_players(players: Iterable[dict], site_id: str) -> list[dict]:
     return [
         player
         for player in players
-        if site_id in (player.get("identifier", "") or "")
-        or site_id in (player.get("name", "") or "")
+        if site_id in (player.get("identifier") or "")
+        or site_id in (player.get("name") or "")
     ]
 
 
-def fetch_player(token: str, player_id: int) -> dict:
-    resp = requests.get(
-        f"{API_BASE_URL}/v1/players/{player_id}",
-        headers={"Authorization": f"Bearer {token}"},
-        timeout=60,
-    )
-    resp.raise_for_status()
-    return resp.json()
-
-
-def patch_player_city(token: str, player_id: int, city_en: str) -> None:
-    resp = requests.patch(
-        f"{API_BASE_URL}/v1/players/{player_id}",
-        headers={
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json-patch+json",
-        },
-        json=[{"op": "replace", "path": "/coordinates/city", "value": city_en}],
-        timeout=60,
-    )
-    resp.raise_for_status()
-
-
-def set_player_reseller(token: str, player_id: int, reseller_en: str) -> None:
+def build_player_index(players: Iterable[dict], site_ids: Iterable[str]) -> dict[str, list[dict]]:
     """
-    Set the M4DS_Reseller variable for a player using:
-      POST /v1/players/{id}/variables
-    as shown in the Swagger screenshot.
+    Map each site id to its players in a single pass over the players,
+    with the same matching as filter_players (site id appears in identifier
+    or name): every identifier/name substring of a site-id length is looked
+    up in the site id set.
     """
-    if not reseller_en:
-        return
+    site_set = set(site_ids)
+    lengths = sorted({len(site_id) for site_id in site_set if site_id})
+    index: dict[str, list[dict]] = defaultdict(list)
 
-    payload = [{"name": "M4DS_Reseller", "value": reseller_en}]
+    for player in players:
+        matched: set[str] = set()
+        for text in (player.get("identifier", "") or "", player.get("name", "") or ""):
+            for length in lengths:
+                for start in range(len(text) - length + 1):
+                    candidate = text[start:start + length]
+                    if candidate in site_set:
+                        matched.add(candidate)
+        for site_id in matched:
+            index[site_id].append(player)
 
-    print(f"  Reseller POST body for player {player_id}: {json.dumps(payload, ensure_ascii=False)}")
+    return index
 
-    resp = requests.post(
-        f"{API_BASE_URL}/v1/players/{player_id}/variables",
-        headers={
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json-patch+json",
-        },
-        json=payload,
+
+def fetch_player(token: str, player_id: int) -> dict:
+    resp = SESSION.get(
+        f"{API_BASE_URL}/v1/players/{player_id}",
+        headers={"Authorization": f"Bearer {token}"},
         timeout=60,
     )
-    if resp.status_code >= 400:
-        try:
-            print(f"  Reseller POST error body: {resp.text}")
-        except Exception:
-            pass
     resp.raise_for_status()
+    return parse_json(resp.content)
 
 
-def set_player_isp(token: str, player_id: int, isp_en: str) -> None:
+def variables_by_name(player: dict) -> dict:
     """
-    Set the M4DS_ISP variable for a player using:
-      POST /v1/players/{id}/variables
+    Return the player's variables as a {name: value} dict so each variable
+    is a single lookup instead of a scan over the variables list.
     """
-    if not isp_en:
-        return
-
-    payload = [{"name": "M4DS_ISP", "value": isp_en}]
-
-    print(f"  ISP POST body for player {player_id}: {json.dumps(payload, ensure_ascii=False)}")
-
-    resp = requests.post(
-        f"{API_BASE_URL}/v1/players/{player_id}/variables",
-        headers={
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json-patch+json",
-        },
-        json=payload,
-        timeout=60,
-    )
-    if resp.status_code >= 400:
-        try:
-            print(f"  ISP POST error body: {resp.text}")
-        except Exception:
-            pass
-    resp.raise_for_status()
+    vars_raw = player.get("variables")
+    if isinstance(vars_raw, dict):
+        vars_raw = (vars_raw,)
+    vars_list = vars_raw if isinstance(vars_raw, (list, tuple)) else ()
+    return {
+        item["name"]: item.get("value")
+        for item in vars_list
+        if isinstance(item, dict) and "name" in item
+    }
 
 
-def set_player_sector(token: str, player_id: int, sector_en: str) -> None:
+def format_player_values(label: str, player: dict) -> list[str]:
     """
-    Set the M4DS_Sector variable for a player using:
-      POST /v1/players/{id}/variables
+    Report lines for the player's city and the variables this script manages.
     """
-    if not sector_en:
-        return
+    city = (player.get("coordinates") or _EMPTY).get("city")
+    variables = variables_by_name(player)
+    return [
+        f"  {label} city: {city!r}",
+        f"  {label} reseller: {variables.get('M4DS_Reseller')!r}",
+        f"  {label} ISP: {variables.get('M4DS_ISP')!r}",
+        f"  {label} sector: {variables.get('M4DS_Sector')!r}",
+        f"  {label} StreamingHot_Muted: {variables.get('M4DS_StreamingHot_Muted')!r}",
+        f"  {label} StreamingTriple_Muted: {variables.get('M4DS_StreamingTriple_Muted')!r}",
+        f"  {label} StreamingVerticalHot_Muted: {variables.get('M4DS_StreamingVerticalHot_Muted')!r}",
+        f"  {label} StreamingVerticalTriple_Muted: {variables.get('M4DS_StreamingVerticalTriple_Muted')!r}",
+    ]
 
-    payload = [{"name": "M4DS_Sector", "value": sector_en}]
 
-    print(f"  Sector POST body for player {player_id}: {json.dumps(payload, ensure_ascii=False)}")
+# JSON Patch body for the city; only the JSON-encoded value is substituted
+CITY_PATCH_TEMPLATE = b'[{"op":"replace","path":"/coordinates/city","value":%s}]'
 
-    resp = requests.post(
-        f"{API_BASE_URL}/v1/players/{player_id}/variables",
+
+def patch_player_city(token: str, player_id: int, city_en: str) -> None:
+    resp = SESSION.patch(
+        f"{API_BASE_URL}/v1/players/{player_id}",
         headers={
             "Authorization": f"Bearer {token}",
             "Content-Type": "application/json-patch+json",
         },
-        json=payload,
+        data=CITY_PATCH_TEMPLATE % dump_json(city_en),
         timeout=60,
     )
-    if resp.status_code >= 400:
-        try:
-            print(f"  Sector POST error body: {resp.text}")
-        except Exception:
-            pass
     resp.raise_for_status()
 
 
-def set_player_streaming_flags(
-    token: str,
-    player_id: int,
-    identifier: str,
-    *,
+def _compute_streaming_flags(
     any_combined: bool,
     any_lh_only: bool,
     any_pv_only: bool,
     is_combined: bool,
     is_lh_only: bool,
     is_pv_only: bool,
-) -> None:
+    ends_with_h: bool,
+    ends_with_t: bool,
+) -> dict[str, str]:
     """
-    Set streaming-muted variables for the given player according to the rules:
+    Compute the streaming-muted variables for a player according to the rules:
 
     Case A – LH-only and PV-only players, no combined (PV_LH/LH_PV):
       - LH-only player(s): one non-vertical flag true (by -H/-T), others false.
@@ -402,15 +631,6 @@ def set_player_streaming_flags(
     Case C – only combined player(s), no alone LH/PV:
       - Combined player(s): vertical flag true (by -H/-T), others false.
     """
-    id_upper = identifier.upper()
-
-    # Debug context
-    print(
-        f"  Streaming flags decision for '{identifier}': "
-        f"any_combined={any_combined}, any_lh_only={any_lh_only}, any_pv_only={any_pv_only}, "
-        f"is_combined={is_combined}, is_lh_only={is_lh_only}, is_pv_only={is_pv_only}"
-    )
-
     # Start with all false
     payload: dict[str, str] = {
         "M4DS_StreamingHot_Muted": "false",
@@ -419,9 +639,6 @@ def set_player_streaming_flags(
         "M4DS_StreamingVerticalTriple_Muted": "false",
     }
 
-    ends_with_h = id_upper.endswith("-H")
-    ends_with_t = id_upper.endswith("-T")
-
     if any_combined:
         # Cases B and C – there is at least one combined player in this number.
         if is_combined:
@@ -459,30 +676,180 @@ def set_player_streaming_flags(
             elif ends_with_t:
                 payload["M4DS_StreamingTriple_Muted"] = "true"
 
-    body = [{"name": name, "value": value} for name, value in payload.items()]
+    return payload
 
-    print(
-        f"  Streaming muted POST body for player {player_id}: "
-        f"{json.dumps(body, ensure_ascii=False)}"
-    )
 
-    resp = requests.post(
+# Every (any_*, is_*, ends_with_h, ends_with_t) combination precomputed at
+# import, so each player costs one dict lookup instead of the decision tree.
+_STREAMING_FLAG_TABLE: dict[tuple[bool, ...], Mapping[str, str]] = {
+    key: MappingProxyType(_compute_streaming_flags(*key))
+    for key in product((False, True), repeat=8)
+}
+
+
+def streaming_flags_payload(
+    identifier: str,
+    *,
+    any_combined: bool,
+    any_lh_only: bool,
+    any_pv_only: bool,
+    is_combined: bool,
+    is_lh_only: bool,
+    is_pv_only: bool,
+    out: Callable[[str], None] = print,
+) -> Mapping[str, str]:
+    """
+    Return the streaming-muted variables for the given player (see
+    _compute_streaming_flags for the rules). The result is shared between
+    players with the same flags and is read-only. Debug lines go to out.
+    """
+    # Debug context
+    if VERBOSE:
+        out(
+            f"  Streaming flags decision for '{identifier}': "
+            f"any_combined={any_combined}, any_lh_only={any_lh_only}, any_pv_only={any_pv_only}, "
+            f"is_combined={is_combined}, is_lh_only={is_lh_only}, is_pv_only={is_pv_only}"
+        )
+
+    id_upper = identifier.upper()
+    return _STREAMING_FLAG_TABLE[
+        (
+            any_combined,
+            any_lh_only,
+            any_pv_only,
+            is_combined,
+            is_lh_only,
+            is_pv_only,
+            id_upper.endswith("-H"),
+            id_upper.endswith("-T"),
+        )
+    ]
+
+
+def set_player_variables(
+    token: str,
+    player_id: int,
+    variables: dict[str, str],
+    out: Callable[[str], None] = print,
+) -> None:
+    """
+    Set several variables for a player in a single call to:
+      POST /v1/players/{id}/variables
+    Empty values are skipped (same as the single-variable setters).
+    Debug and error-body lines go to out.
+    """
+    body = [{"name": name, "value": value} for name, value in variables.items() if value]
+    if not body:
+        return
+
+    data = dump_json(body)
+    if VERBOSE:
+        out(f"  Variables POST body for player {player_id}: {data.decode('utf-8')}")
+
+    resp = SESSION.post(
         f"{API_BASE_URL}/v1/players/{player_id}/variables",
         headers={
             "Authorization": f"Bearer {token}",
             "Content-Type": "application/json-patch+json",
         },
-        json=body,
+        data=data,
         timeout=60,
     )
-    # Log response body for debugging regardless of status
-    try:
-        print(f"  Streaming muted POST status: {resp.status_code}, body: {resp.text}")
-    except Exception:
-        pass
+    if resp.status_code >= 400:
+        try:
+            out(f"  Variables POST error body: {resp.text}")
+        except Exception:
+            pass
     resp.raise_for_status()
 
 
+def process_player(
+    player: dict,
+    tm: TokenManager,
+    city_en: str,
+    reseller_en: str,
+    isp_en: str,
+    sector_en: str,
+    group_flags: dict[str, bool],
+    out: Callable[[str], None] | None = None,
+) -> bool:
+    """
+    Update one player's city and variables; with M4D_VERBOSE also report
+    the values before and after. The player must have been classified by
+    annotate_players. Empty values are not sent. Returns False if an update
+    failed. Report lines go to out; without it they are collected and
+    printed as one block so parallel players do not interleave.
+    """
+    player_id = player.get("playerId") or player.get("id")
+    identifier = (player.get("identifier") or player.get("name", "")).strip()
+    lines: list[str] = []
+    if out is None:
+        out = lines.append
+    try:
+        if player_id is None:
+            out(f"Skipping player without id: {identifier}")
+            return True
+
+        out(f"\nProcessing player {identifier} (id {player_id})")
+        if VERBOSE:
+            current = call_with_token(tm, fetch_player, player_id)
+            for line in format_player_values("Current", current):
+                out(line)
+
+        # Patch city
+        call_with_token(tm, patch_player_city, player_id, city_en)
+
+        # Streaming-muted flags based on identifier and group rules
+        streaming = streaming_flags_payload(
+            identifier,
+            **group_flags,
+            is_combined=player["_is_combined"],
+            is_lh_only=player["_is_lh_only"],
+            is_pv_only=player["_is_pv_only"],
+            out=out,
+        )
+
+        # Set reseller, ISP, sector and streaming flags in one
+        # POST /v1/players/{id}/variables
+        variables = {
+            "M4DS_Reseller": reseller_en,
+            "M4DS_ISP": isp_en,
+            "M4DS_Sector": sector_en,
+            **streaming,
+        }
+        call_with_token(tm, set_player_variables, player_id, variables, out=out)
+
+        if VERBOSE:
+            # Fetch updated player and show new values
+            updated = call_with_token(tm, fetch_player, player_id)
+            for line in format_player_values("Updated", updated):
+                out(line)
+        return True
+    except requests.HTTPError as exc:
+        out(f"  [ERROR] API call failed: {exc}")
+        return False
+    except Exception as exc:
+        out(f"  [ERROR] Unexpected error: {exc}")
+        return False
+    finally:
+        if lines:
+            with _PRINT_LOCK:
+                print("\n".join(lines), flush=True)
+
+
+def pause_before_exit(seconds: int, prefix: str = "") -> None:
+    """
+    Keep a double-clicked console window open for a few seconds before the
+    script exits. Piped or redirected stdin and M4D_NO_WAIT=1 skip the pause.
+    """
+    if sys.stdin.isatty() and os.environ.get("M4D_NO_WAIT") != "1":
+        try:
+            print(f"\n{prefix}Exiting in {seconds} seconds...")
+            time.sleep(seconds)
+        except KeyboardInterrupt:
+            pass
+
+
 def main() -> None:
     if not CSV_FILE.exists():
         raise FileNotFoundError(f"CSV file not found: {CSV_FILE}")
@@ -514,9 +881,10 @@ def main() -> None:
 
     api_key, organization = get_api_credentials()
 
-    token = request_token(api_key, organization)
-    players = fetch_players(token)
-    target_players = filter_players(players, site_id)
+    # One token for the whole run, refreshed only on expiry or 401
+    tm = TokenManager(api_key, organization)
+    # Only the matched players are kept; the full list is freed right away
+    target_players = filter_players(call_with_token(tm, fetch_players), site_id)
 
     if not target_players:
         print(f"No players found containing '{site_id}'. Nothing to update.")
@@ -526,165 +894,19 @@ def main() -> None:
 
     # Determine, within this site/number, whether there are LH-only, PV-only
     # and/or combined (PV_LH/LH_PV) players.
-    any_lh_only = False
-    any_pv_only = False
-    any_combined = False
-    for p in target_players:
-        ident_raw = (p.get("identifier") or p.get("name") or "").strip()
-        ident = ident_raw.upper()
-        has_lh = "LH" in ident
-        has_pv = "PV" in ident
-        is_combined = "PV_LH" in ident or "LH_PV" in ident
-        if is_combined:
-            any_combined = True
-        elif has_lh and not has_pv:
-            any_lh_only = True
-        elif has_pv and not has_lh:
-            any_pv_only = True
-
-    for player in target_players:
-        player_id = player.get("playerId") or player.get("id")
-        identifier = (player.get("identifier") or player.get("name", "")).strip()
-        if player_id is None:
-            print(f"Skipping player without id: {identifier}")
-            continue
-
-        try:
-            print(f"\nProcessing player {identifier} (id {player_id})")
-            token = request_token(api_key, organization)  # fresh token per player
-            current = fetch_player(token, player_id)
-
-            # Current city
-            current_city = (current.get("coordinates") or {}).get("city")
-
-            # Current reseller from variables list (name == "M4DS_Reseller")
-            vars_raw = current.get("variables") or []
-            if isinstance(vars_raw, dict):
-                vars_list = [vars_raw]
-            elif isinstance(vars_raw, list):
-                vars_list = vars_raw
-            else:
-                vars_list = []
-
-            current_reseller = None
-            current_isp = None
-            current_sector = None
-            current_stream_hot = None
-            current_stream_triple = None
-            current_stream_vert_hot = None
-            current_stream_vert_triple = None
-            reseller_index: int | None = None
-            for idx, item in enumerate(vars_list):
-                if not isinstance(item, dict):
-                    continue
-                if item.get("name") == "M4DS_Reseller":
-                    reseller_index = idx
-                    current_reseller = item.get("value")
-                if item.get("name") == "M4DS_ISP":
-                    current_isp = item.get("value")
-                if item.get("name") == "M4DS_Sector":
-                    current_sector = item.get("value")
-                if item.get("name") == "M4DS_StreamingHot_Muted":
-                    current_stream_hot = item.get("value")
-                if item.get("name") == "M4DS_StreamingTriple_Muted":
-                    current_stream_triple = item.get("value")
-                if item.get("name") == "M4DS_StreamingVerticalHot_Muted":
-                    current_stream_vert_hot = item.get("value")
-                if item.get("name") == "M4DS_StreamingVerticalTriple_Muted":
-                    current_stream_vert_triple = item.get("value")
-
-            print(f"  Current city: {current_city!r}")
-            print(f"  Current reseller: {current_reseller!r}")
-            print(f"  Current ISP: {current_isp!r}")
-            print(f"  Current sector: {current_sector!r}")
-            print(f"  Current StreamingHot_Muted: {current_stream_hot!r}")
-            print(f"  Current StreamingTriple_Muted: {current_stream_triple!r}")
-            print(f"  Current StreamingVerticalHot_Muted: {current_stream_vert_hot!r}")
-            print(f"  Current StreamingVerticalTriple_Muted: {current_stream_vert_triple!r}")
-
-            # Patch city
-            patch_player_city(token, player_id, city_en)
-
-            # Set reseller, ISP, and sector via POST /v1/players/{id}/variables
-            token = request_token(api_key, organization)
-            set_player_reseller(token, player_id, reseller_en)
-            token = request_token(api_key, organization)
-            set_player_isp(token, player_id, isp_en)
-            token = request_token(api_key, organization)
-            set_player_sector(token, player_id, sector_en)
-
-            # Set streaming-muted flags based on identifier and group rules
-            ident_upper = identifier.upper()
-            has_lh = "LH" in ident_upper
-            has_pv = "PV" in ident_upper
-            is_combined = "PV_LH" in ident_upper or "LH_PV" in ident_upper
-            is_lh_only = has_lh and not has_pv and not is_combined
-            is_pv_only = has_pv and not has_lh and not is_combined
-
-            token = request_token(api_key, organization)
-            set_player_streaming_flags(
-                token,
-                player_id,
-                identifier,
-                any_combined=any_combined,
-                any_lh_only=any_lh_only,
-                any_pv_only=any_pv_only,
-                is_combined=is_combined,
-                is_lh_only=is_lh_only,
-                is_pv_only=is_pv_only,
-            )
-
-            # Fetch updated player and show new values
-            token = request_token(api_key, organization)
-            updated = fetch_player(token, player_id)
-
-            new_city = (updated.get("coordinates") or {}).get("city")
-
-            updated_vars_raw = updated.get("variables") or []
-            if isinstance(updated_vars_raw, dict):
-                updated_vars_list = [updated_vars_raw]
-            elif isinstance(updated_vars_raw, list):
-                updated_vars_list = updated_vars_raw
-            else:
-                updated_vars_list = []
-
-            new_reseller = None
-            new_isp = None
-            new_sector = None
-            new_stream_hot = None
-            new_stream_triple = None
-            new_stream_vert_hot = None
-            new_stream_vert_triple = None
-            for item in updated_vars_list:
-                if not isinstance(item, dict):
-                    continue
-                if item.get("name") == "M4DS_Reseller":
-                    new_reseller = item.get("value")
-                if item.get("name") == "M4DS_ISP":
-                    new_isp = item.get("value")
-                if item.get("name") == "M4DS_Sector":
-                    new_sector = item.get("value")
-                if item.get("name") == "M4DS_StreamingHot_Muted":
-                    new_stream_hot = item.get("value")
-                if item.get("name") == "M4DS_StreamingTriple_Muted":
-                    new_stream_triple = item.get("value")
-                if item.get("name") == "M4DS_StreamingVerticalHot_Muted":
-                    new_stream_vert_hot = item.get("value")
-                if item.get("name") == "M4DS_StreamingVerticalTriple_Muted":
-                    new_stream_vert_triple = item.get("value")
-
-            print(f"  Updated city: {new_city!r}")
-            print(f"  Updated reseller: {new_reseller!r}")
-            print(f"  Updated ISP: {new_isp!r}")
-            print(f"  Updated sector: {new_sector!r}")
-            print(f"  Updated StreamingHot_Muted: {new_stream_hot!r}")
-            print(f"  Updated StreamingTriple_Muted: {new_stream_triple!r}")
-            print(f"  Updated StreamingVerticalHot_Muted: {new_stream_vert_hot!r}")
-            print(f"  Updated StreamingVerticalTriple_Muted: {new_stream_vert_triple!r}")
-        except requests.HTTPError as exc:
-            print(f"  [ERROR] API call failed: {exc}")
-        except Exception as exc:
-            print(f"  [ERROR] Unexpected error: {exc}")
+    annotate_players(target_players)
+    group_flags = {
+        "any_combined": any(p["_is_combined"] for p in target_players),
+        "any_lh_only": any(p["_is_lh_only"] for p in target_players),
+        "any_pv_only": any(p["_is_pv_only"] for p in target_players),
+    }
+    with ThreadPoolExecutor(max_workers=MAX_PLAYER_WORKERS) as ex:
+        futures = [
+            ex.submit(process_player, player, tm, city_en, reseller_en, isp_en, sector_en, group_flags)
+            for player in target_players
+        ]
+        for future in as_completed(futures):
+            future.result()
 
     return 0
 
@@ -697,10 +919,6 @@ if __name__ == "__main__":
         print(f"[ERROR] {exc}")
         exit_code = 1
     finally:
-        try:
-            print("\nExiting in 6 seconds...")
-            time.sleep(6)
-        except KeyboardInterrupt:
-            pass
+        pause_before_exit(6)
     sys.exit(exit_code)
 
@@ -4,52 +4,119 @@ Checks if current values exist in dictionaries, and if not, looks up correct val
 from CSV and updates the player.
 """
 
+from __future__ import annotations
+
 import csv
-import json
-import os
 import re
 import sys
-import time
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import Iterable, Optional
+from typing import Callable, Optional
 
 import requests
 
+# Shared with update_player_city: the retrying SESSION, token handling,
+# credentials, dictionary loading and the player API calls
+from update_player_city import (
+    API_BASE_URL,
+    CSV_FILE,
+    DICT_FILE,
+    SESSION,
+    TokenManager,
+    call_with_token,
+    fetch_player,
+    get_api_credentials,
+    iter_csv_rows,
+    load_dictionaries,
+    normalize_text,
+    normalized_dictionary,
+    parse_json,
+    patch_player_city,
+    pause_before_exit,
+    set_player_variables,
+    translate_sector,
+)
+
+
+# Players checked concurrently
+MAX_PLAYER_WORKERS = 8
+# Keeps each player's report in one block when players run in parallel
+_PRINT_LOCK = threading.Lock()
+
+# Stand-alone 6-digit site number anywhere in an identifier
+_SITE_NUMBER_ANYWHERE = re.compile(r"\b(\d{6})\b")
+
+# (city, reseller, sector) rows per site number, filled once by load_csv_cached
+_SITE_INDEX: Optional[dict[str, list[tuple[str, str, str]]]] = None
+
+
+def normalize_value(value):
+    """normalize_text for API values, which may be missing or not a string."""
+    return normalize_text(value) if isinstance(value, str) else value
+
+
+def load_csv_cached() -> dict[str, list[tuple[str, str, str]]]:
+    """
+    Read the CSV once per run and index its rows by site number as
+    (city, reseller, sector) tuples in file order, with NBSP replaced and
+    whitespace stripped. A column missing from the header yields empty values.
+    """
+    global _SITE_INDEX
+    if _SITE_INDEX is not None:
+        return _SITE_INDEX
 
-CSV_FILE = Path("_1ec01f0כרטיס מכשיר(DataSheet).csv")
-DICT_FILE = Path("dictionaries.json")
-API_BASE_URL = "https://m4d-srv.ctv.co.il/media4display-api"
+    rows = iter_csv_rows(CSV_FILE)
+    header = next(rows, None)
+    if header is None:
+        raise RuntimeError(f"CSV file {CSV_FILE} is empty.")
 
+    def column(name: str) -> Optional[int]:
+        return header.index(name) if name in header else None
 
-def iter_csv_rows(path: Path, encodings: Iterable[str]) -> Iterable[list[str]]:
-    """Try to read CSV file with multiple encodings."""
-    for encoding in encodings:
-        try:
-            with path.open("r", encoding=encoding, newline="") as fh:
-                reader = csv.reader(fh)
-                header = next(reader, None)
-                if header is None:
-                    continue
-                yield header
-                for row in reader:
-                    yield row
-                return
-        except Exception:
-            continue
-    raise RuntimeError(f"Unable to read CSV file {path} with provided encodings.")
+    site_idx = column("מספר אתר/תאור אתר")
+    field_idxs = (column("עיר האתר"), column("תאור משווק"), column("סוג תוכן"))
+
+    index: dict[str, list[tuple[str, str, str]]] = defaultdict(list)
+    if site_idx is not None:
+        for row in rows:
+            if len(row) <= site_idx:
+                continue
+            fields = tuple(
+                normalize_text(row[idx]) if idx is not None and len(row) > idx else ""
+                for idx in field_idxs
+            )
+            index[row[site_idx].strip()].append(fields)
+
+    _SITE_INDEX = dict(index)
+    return _SITE_INDEX
 
 
-def load_dictionaries() -> dict:
-    """Load translation dictionaries from JSON file."""
-    with DICT_FILE.open("r", encoding="utf-8") as fh:
-        return json.load(fh)
+def find_site_value(site_number: str, field: int, keys: dict[str, str]) -> Optional[str]:
+    """
+    Return the CSV value at position field of the site's (city, reseller,
+    sector) rows. If multiple rows exist for the site, the first value that
+    is one of the (normalized) dictionary keys wins, otherwise the first
+    non-empty value. Returns None if not found.
+    """
+    first_found = None
+    for row in load_csv_cached().get(site_number, ()):
+        value = row[field]
+        if not value:
+            continue
+        if value in keys:
+            return value
+        if first_found is None:
+            first_found = value
+    return first_found
 
 
-def get_all_dictionary_values(dictionaries: dict, dict_key: str) -> set[str]:
+def get_all_dictionary_values(dictionaries: dict, dict_key: str) -> frozenset[str]:
     """Get all values from a dictionary (e.g., all values from cities_dictionary)."""
     d = dictionaries.get(dict_key, {})
-    return set(value for value in d.values() if value)
+    return frozenset(normalize_text(value) for value in d.values() if value)
 
 
 def extract_site_number(identifier: str) -> Optional[str]:
@@ -62,13 +129,13 @@ def extract_site_number(identifier: str) -> Optional[str]:
         return None
     
     # Try to extract numeric site number (typically 6 digits)
-    # Look for pattern like 200010 at the start
-    match = re.match(r"(\d{6})", identifier.strip())
-    if match:
-        return match.group(1)
+    # Look for pattern like 200010 at the start (isdecimal is what \d matches)
+    head = identifier.strip()[:6]
+    if len(head) == 6 and head.isdecimal():
+        return head
     
     # Fallback: try to find any 6-digit number
-    match = re.search(r"\b(\d{6})\b", identifier)
+    match = _SITE_NUMBER_ANYWHERE.search(identifier)
     if match:
         return match.group(1)
     
@@ -81,44 +148,7 @@ def find_site_city(site_number: str, dictionaries: dict) -> Optional[str]:
     If multiple rows exist for the site, prioritizes values that exist in cities_dictionary.
     Returns None if not found.
     """
-    encodings = ("utf-8-sig", "utf-8", "windows-1255", "cp1255", "iso-8859-8", "latin1")
-    rows = iter_csv_rows(CSV_FILE, encodings)
-    header = next(rows)
-
-    try:
-        site_idx = header.index("מספר אתר/תאור אתר")
-        city_idx = header.index("עיר האתר")
-    except ValueError:
-        return None
-
-    cities_dictionary = dictionaries.get("cities_dictionary", {})
-    city_keys = set(key.replace("\u00a0", " ").strip() for key in cities_dictionary.keys())
-    
-    cities_found = []
-    dictionary_match = None
-    
-    # Check all rows for this site
-    for row in rows:
-        if len(row) <= max(site_idx, city_idx):
-            continue
-        if row[site_idx].strip() == site_number:
-            city = row[city_idx].replace("\u00a0", " ").strip()
-            if city:
-                cities_found.append(city)
-                # Check if this city is in the dictionary
-                if city in city_keys:
-                    dictionary_match = city
-                    break  # Found a dictionary match, use it
-    
-    # If we found a dictionary match, return it
-    if dictionary_match:
-        return dictionary_match
-    
-    # Otherwise, return the first non-empty city found
-    if cities_found:
-        return cities_found[0]
-    
-    return None
+    return find_site_value(site_number, 0, normalized_dictionary(dictionaries, "cities_dictionary"))
 
 
 def find_site_reseller(site_number: str, dictionaries: dict) -> Optional[str]:
@@ -127,62 +157,17 @@ def find_site_reseller(site_number: str, dictionaries: dict) -> Optional[str]:
     If multiple rows exist for the site, prioritizes values that exist in reseller_dictionary.
     Returns None if not found.
     """
-    encodings = ("utf-8-sig", "utf-8", "windows-1255", "cp1255", "iso-8859-8", "latin1")
-    rows = iter_csv_rows(CSV_FILE, encodings)
-    header = next(rows)
-
-    try:
-        site_idx = header.index("מספר אתר/תאור אתר")
-        reseller_idx = header.index("תאור משווק")
-    except ValueError:
-        return None
-
-    reseller_dictionary = dictionaries.get("reseller_dictionary", {})
-    reseller_keys = set(key.replace("\u00a0", " ").strip() for key in reseller_dictionary.keys())
-    
-    resellers_found = []
-    dictionary_match = None
-    
-    # Check all rows for this site
-    for row in rows:
-        if len(row) <= max(site_idx, reseller_idx):
-            continue
-        if row[site_idx].strip() == site_number:
-            reseller = row[reseller_idx].replace("\u00a0", " ").strip()
-            if reseller:
-                resellers_found.append(reseller)
-                # Check if this reseller is in the dictionary
-                if reseller in reseller_keys:
-                    dictionary_match = reseller
-                    break  # Found a dictionary match, use it
-    
-    # If we found a dictionary match, return it
-    if dictionary_match:
-        return dictionary_match
-    
-    # Otherwise, return the first non-empty reseller found
-    if resellers_found:
-        return resellers_found[0]
-    
-    return None
+    return find_site_value(site_number, 1, normalized_dictionary(dictionaries, "reseller_dictionary"))
 
 
 def translate_city(city_he: str, dictionaries: dict) -> Optional[str]:
     """Translate Hebrew city name to English code using cities_dictionary."""
-    cities = dictionaries.get("cities_dictionary", {})
-    for key, value in cities.items():
-        if key.replace("\u00a0", " ").strip() == city_he:
-            return value
-    return None
+    return normalized_dictionary(dictionaries, "cities_dictionary").get(city_he)
 
 
 def translate_reseller(reseller_he: str, dictionaries: dict) -> Optional[str]:
     """Translate Hebrew reseller name to English code using reseller_dictionary."""
-    resellers = dictionaries.get("reseller_dictionary", {})
-    for key, value in resellers.items():
-        if key.replace("\u00a0", " ").strip() == reseller_he:
-            return value
-    return None
+    return normalized_dictionary(dictionaries, "reseller_dictionary").get(reseller_he)
 
 
 def find_site_sector(site_number: str, dictionaries: dict) -> Optional[str]:
@@ -191,95 +176,19 @@ def find_site_sector(site_number: str, dictionaries: dict) -> Optional[str]:
     If multiple rows exist for the site, prioritizes values that exist in sector_dictionary.
     Returns None if not found.
     """
-    encodings = ("utf-8-sig", "utf-8", "windows-1255", "cp1255", "iso-8859-8", "latin1")
-    rows = iter_csv_rows(CSV_FILE, encodings)
-    header = next(rows)
-
-    try:
-        site_idx = header.index("מספר אתר/תאור אתר")
-        sector_idx = header.index("סוג תוכן")
-    except ValueError:
-        return None
-
-    sector_dictionary = dictionaries.get("sector_dictionary", {})
-    sector_keys = set(key.replace("\u00a0", " ").strip() for key in sector_dictionary.keys())
-    
-    sectors_found = []
-    dictionary_match = None
-    
-    # Check all rows for this site
-    for row in rows:
-        if len(row) <= max(site_idx, sector_idx):
-            continue
-        if row[site_idx].strip() == site_number:
-            sector = row[sector_idx].replace("\u00a0", " ").strip()
-            if sector:
-                sectors_found.append(sector)
-                # Check if this sector is in the dictionary
-                if sector in sector_keys:
-                    dictionary_match = sector
-                    break  # Found a dictionary match, use it
-    
-    # If we found a dictionary match, return it
-    if dictionary_match:
-        return dictionary_match
-    
-    # Otherwise, return the first non-empty sector found
-    if sectors_found:
-        return sectors_found[0]
-    
-    return None
-
-
-def translate_sector(sector_he: str, dictionaries: dict) -> str:
-    """
-    Translate Hebrew sector/content type to English code using sector_dictionary.
-    If not found in dictionary, returns "GENERAL".
-    """
-    sectors = dictionaries.get("sector_dictionary", {})
-    for key, value in sectors.items():
-        if key.replace("\u00a0", " ").strip() == sector_he:
-            return value
-    # If not found in dictionary, return "GENERAL"
-    return "GENERAL"
-
-
-def get_api_credentials() -> tuple[str, str]:
-    """Prompt the user for the API key and organization."""
-    api_key = input("Enter API key: ").strip()
-    if not api_key:
-        raise RuntimeError("API key is required.")
-
-    organization = os.environ.get("M4D_ORG")
-    if not organization:
-        organization = input("Enter organization: ").strip()
-    if not organization:
-        raise RuntimeError("Organization is required.")
-
-    return api_key, organization
-
-
-def request_token(api_key: str, organization: str) -> str:
-    """Get authentication token from the API."""
-    resp = requests.post(
-        f"{API_BASE_URL}/v1/token",
-        json={"apiKey": api_key, "organization": organization},
-        timeout=30,
-    )
-    resp.raise_for_status()
-    return resp.text.strip('"')
+    return find_site_value(site_number, 2, normalized_dictionary(dictionaries, "sector_dictionary"))
 
 
 def fetch_all_players(token: str) -> list[dict]:
     """Fetch all players from the API."""
     print("[INFO] Fetching all players from API...")
-    resp = requests.get(
+    resp = SESSION.get(
         f"{API_BASE_URL}/v1/players",
         headers={"Authorization": f"Bearer {token}"},
         timeout=120,
     )
     resp.raise_for_status()
-    players = resp.json()
+    players = parse_json(resp.content)
     
     if not isinstance(players, list):
         print(f"[WARN] API returned non-list response. Type: {type(players)}")
@@ -289,94 +198,22 @@ def fetch_all_players(token: str) -> list[dict]:
     return players
 
 
-def fetch_player(token: str, player_id: int) -> dict:
-    """Fetch detailed information for a specific player."""
-    resp = requests.get(
-        f"{API_BASE_URL}/v1/players/{player_id}",
-        headers={"Authorization": f"Bearer {token}"},
-        timeout=60,
-    )
-    resp.raise_for_status()
-    return resp.json()
-
-
-def patch_player_city(token: str, player_id: int, city_en: str) -> None:
-    """Update player city using PATCH. This does NOT delete anything - only updates the city value."""
-    resp = requests.patch(
-        f"{API_BASE_URL}/v1/players/{player_id}",
-        headers={
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json-patch+json",
-        },
-        json=[{"op": "replace", "path": "/coordinates/city", "value": city_en}],
-        timeout=60,
-    )
-    resp.raise_for_status()
-
-
-def set_player_reseller(token: str, player_id: int, reseller_en: str) -> None:
-    """Set the M4DS_Reseller variable for a player. This does NOT delete anything - only updates/adds the variable."""
-    if not reseller_en:
-        return
-
-    payload = [{"name": "M4DS_Reseller", "value": reseller_en}]
-
-    resp = requests.post(
-        f"{API_BASE_URL}/v1/players/{player_id}/variables",
-        headers={
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json-patch+json",
-        },
-        json=payload,
-        timeout=60,
-    )
-    if resp.status_code >= 400:
-        try:
-            print(f"  Reseller POST error body: {resp.text}")
-        except Exception:
-            pass
-    resp.raise_for_status()
-
-
-def set_player_sector(token: str, player_id: int, sector_en: str) -> None:
-    """Set the M4DS_Sector variable for a player. This does NOT delete anything - only updates/adds the variable."""
-    if not sector_en:
-        return
-
-    payload = [{"name": "M4DS_Sector", "value": sector_en}]
-
-    resp = requests.post(
-        f"{API_BASE_URL}/v1/players/{player_id}/variables",
-        headers={
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json-patch+json",
-        },
-        json=payload,
-        timeout=60,
-    )
-    if resp.status_code >= 400:
-        try:
-            print(f"  Sector POST error body: {resp.text}")
-        except Exception:
-            pass
-    resp.raise_for_status()
-
-
 def validate_and_correct_player(
     player: dict,
     dictionaries: dict,
-    valid_cities: set[str],
-    valid_resellers: set[str],
-    valid_sectors: set[str],
-    api_key: str,
-    organization: str,
+    valid_cities: frozenset[str],
+    valid_resellers: frozenset[str],
+    valid_sectors: frozenset[str],
+    tm: TokenManager,
+    out: Callable[[str], None] = print,
 ) -> dict:
     """
     Validate and correct a single player.
+    Progress lines are passed to out (print by default).
     Returns dict with validation results.
     """
     player_id = player.get("playerId") or player.get("id")
-    identifier = (player.get("identifier") or player.get("name", "")).strip()
+    identifier = (player.get("identifier") or player.get("name") or "").strip()
 
     result = {
         "player_id": player_id,
@@ -405,9 +242,11 @@ def validate_and_correct_player(
         return result
 
     try:
-        # Fetch full player details
-        token = request_token(api_key, organization)
-        player_details = fetch_player(token, player_id)
+        # Fetch full player details, unless the bulk list already carried them
+        if "coordinates" in player and "variables" in player:
+            player_details = player
+        else:
+            player_details = call_with_token(tm, fetch_player, player_id)
 
         # Get current values
         coords = player_details.get("coordinates") or {}
@@ -435,9 +274,9 @@ def validate_and_correct_player(
         result["original_reseller"] = current_reseller or ""
         result["original_sector"] = current_sector or ""
 
-        # Validate city
+        # Validate city (stray NBSP/whitespace from the API is not an invalid value)
         city_valid = False
-        if current_city and current_city in valid_cities:
+        if current_city and normalize_value(current_city) in valid_cities:
             city_valid = True
         else:
             result["city_invalid"] = True
@@ -445,7 +284,7 @@ def validate_and_correct_player(
 
         # Validate reseller
         reseller_valid = False
-        if current_reseller and current_reseller in valid_resellers:
+        if current_reseller and normalize_value(current_reseller) in valid_resellers:
             reseller_valid = True
         else:
             result["reseller_invalid"] = True
@@ -456,42 +295,45 @@ def validate_and_correct_player(
         reseller_status = "✓ OK" if reseller_valid else "✗ INVALID"
         overall_status = "✓ OK" if not result["needs_correction"] else "✗ NEEDS CORRECTION"
         
-        print(f"\n[{overall_status}] Player: {identifier} (ID: {player_id})")
-        print(f"  City: {current_city or '(empty)'} - {city_status}")
-        print(f"  Reseller: {current_reseller or '(empty)'} - {reseller_status}")
-        print(f"  Sector: {current_sector or '(empty)'}")
+        out(f"\n[{overall_status}] Player: {identifier} (ID: {player_id})")
+        out(f"  City: {current_city or '(empty)'} - {city_status}")
+        out(f"  Reseller: {current_reseller or '(empty)'} - {reseller_status}")
+        out(f"  Sector: {current_sector or '(empty)'}")
 
         # Extract site number once for all lookups
         site_number = extract_site_number(identifier)
         result["site_number"] = site_number
 
-        # Always check and correct sector (no validation step - always lookup from CSV)
-        sector_he = None
-        expected_sector_en = None
-        if site_number:
-            # Look up correct sector from CSV
-            sector_he = find_site_sector(site_number, dictionaries)
-            if sector_he:
-                # Translate Hebrew to English code
-                expected_sector_en = translate_sector(sector_he, dictionaries)
-            else:
-                # No sector found in CSV - use GENERAL as default
-                expected_sector_en = "GENERAL"
-            
-            # Compare current sector with expected sector
-            if current_sector != expected_sector_en:
-                result["sector_invalid"] = True
-                result["needs_correction"] = True
-                print(f"    Sector needs update: {current_sector or '(empty)'} → {expected_sector_en}")
+        # Without a site number there is nothing in the CSV to check or correct against
+        if not site_number:
+            if result["needs_correction"]:
+                result["error"] = "Could not extract site number from identifier"
             else:
-                print(f"    Sector is correct: {expected_sector_en}")
+                out(f"  [WARN] No site number in identifier, sector not checked")
+                out(f"  ✓ All values are correct, no update needed")
+            return result
+
+        # Always check and correct sector (no validation step - always lookup from CSV)
+        # Look up correct sector from CSV
+        sector_he = find_site_sector(site_number, dictionaries)
+        if sector_he:
+            # Translate Hebrew to English code, normalized like valid_sectors
+            # so it compares with the normalized current value
+            expected_sector_en = normalize_value(translate_sector(sector_he, dictionaries))
+        else:
+            # No sector found in CSV - use GENERAL as default
+            expected_sector_en = "GENERAL"
+
+        # Compare current sector with expected sector
+        if normalize_value(current_sector) != expected_sector_en:
+            result["sector_invalid"] = True
+            result["needs_correction"] = True
+            out(f"    Sector needs update: {current_sector or '(empty)'} → {expected_sector_en}")
+        else:
+            out(f"    Sector is correct: {expected_sector_en}")
 
         # If validation fails, try to correct
         if result["needs_correction"]:
-            if not site_number:
-                result["error"] = "Could not extract site number from identifier"
-                return result
-
             # Look up correct values from CSV
             city_he = find_site_city(site_number, dictionaries) if result["city_invalid"] else None
             reseller_he = find_site_reseller(site_number, dictionaries) if result["reseller_invalid"] else None
@@ -524,35 +366,38 @@ def validate_and_correct_player(
             sector_en = expected_sector_en if result["sector_invalid"] else None
 
             # Update player
-            print(f"  → Correcting values:")
+            out(f"  → Correcting values:")
             if result["city_invalid"] and city_en:
-                print(f"    City: {current_city or '(empty)'} → {city_en}")
+                out(f"    City: {current_city or '(empty)'} → {city_en}")
             if result["reseller_invalid"] and reseller_en:
-                print(f"    Reseller: {current_reseller or '(empty)'} → {reseller_en}")
+                out(f"    Reseller: {current_reseller or '(empty)'} → {reseller_en}")
             if result["sector_invalid"] and sector_en:
-                print(f"    Sector: {current_sector or '(empty)'} → {sector_en}")
+                out(f"    Sector: {current_sector or '(empty)'} → {sector_en}")
 
             try:
-                token = request_token(api_key, organization)
                 if result["city_invalid"] and city_en:
-                    patch_player_city(token, player_id, city_en)
+                    call_with_token(tm, patch_player_city, player_id, city_en)
                     result["city_changed"] = True
                     result["new_city"] = city_en
-                    print(f"    ✓ City updated successfully")
+                    out(f"    ✓ City updated successfully")
 
+                # Reseller and sector go out in one variables POST
+                variables = {}
                 if result["reseller_invalid"] and reseller_en:
-                    token = request_token(api_key, organization)
-                    set_player_reseller(token, player_id, reseller_en)
+                    variables["M4DS_Reseller"] = reseller_en
+                if result["sector_invalid"] and sector_en:
+                    variables["M4DS_Sector"] = sector_en
+                call_with_token(tm, set_player_variables, player_id, variables, out=out)
+
+                if "M4DS_Reseller" in variables:
                     result["reseller_changed"] = True
                     result["new_reseller"] = reseller_en
-                    print(f"    ✓ Reseller updated successfully")
+                    out(f"    ✓ Reseller updated successfully")
 
-                if result["sector_invalid"] and sector_en:
-                    token = request_token(api_key, organization)
-                    set_player_sector(token, player_id, sector_en)
+                if "M4DS_Sector" in variables:
                     result["sector_changed"] = True
                     result["new_sector"] = sector_en
-                    print(f"    ✓ Sector updated successfully")
+                    out(f"    ✓ Sector updated successfully")
 
                 result["updated"] = True
             except requests.HTTPError as exc:
@@ -564,101 +409,101 @@ def validate_and_correct_player(
                     except Exception:
                         pass
                 result["error"] = error_msg
-                print(f"    ✗ {error_msg}")
+                out(f"    ✗ {error_msg}")
                 return result
             except Exception as exc:
                 result["error"] = f"Unexpected error during update: {exc}"
-                print(f"    ✗ {result['error']}")
+                out(f"    ✗ {result['error']}")
                 return result
         else:
             # Player is valid, no correction needed
-            print(f"  ✓ All values are correct, no update needed")
+            out(f"  ✓ All values are correct, no update needed")
 
     except Exception as exc:
         result["error"] = str(exc)
-        print(f"  [ERROR] Failed to process player {identifier} (ID: {player_id}): {exc}")
+        out(f"  [ERROR] Failed to process player {identifier} (ID: {player_id}): {exc}")
 
     return result
 
 
-def write_results_csv(results: list[dict], output_file: Path, total_players: int, processed_count: int) -> None:
+RESULTS_CSV_FIELDNAMES = [
+    "Player ID",
+    "Player Identifier",
+    "Site Number",
+    "City Status",
+    "Reseller Status",
+    "Sector Status",
+    "Error Message",
+]
+
+
+def open_results_csv(output_file: Path, total_players: int, processed_count: int):
     """
-    Write validation results to a CSV file.
-    
+    Open the validation results CSV, write the report header and return (file, writer).
+
+    Rows are appended as players finish, so a crash keeps everything written so far.
     IMPORTANT: This CSV only contains players that were actually checked/processed.
     Players that were not processed (due to test mode limits) are NOT included.
     This script does NOT delete any players - it only updates existing player data.
     """
-    if not results:
-        return
-    
-    fieldnames = [
-        "Player ID",
-        "Player Identifier",
-        "Site Number",
-        "City Status",
-        "Reseller Status",
-        "Sector Status",
-        "Error Message",
-    ]
-    
-    with output_file.open("w", encoding="utf-8-sig", newline="") as fh:
-        # Write explanation header for Notepad readability
-        fh.write(f"Player Validation Results Report\n")
-        fh.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        fh.write(f"Total players in system: {total_players}\n")
-        fh.write(f"Players checked in this run: {processed_count}\n")
-        fh.write(f"Players in this CSV (with errors or updates): {len(results)}\n")
-        fh.write(f"\n")
-        fh.write(f"IMPORTANT NOTES:\n")
-        fh.write(f"- This CSV contains ONLY players with ERRORS or UPDATES\n")
-        fh.write(f"- Players that were OK (no changes needed) are NOT included\n")
-        fh.write(f"- Players not checked remain completely untouched in the system\n")
-        fh.write(f"- This script does NOT delete any players - it only updates data\n")
-        fh.write(f"\n")
-        fh.write(f"{'='*100}\n")
-        fh.write(f"DATA STARTS BELOW\n")
-        fh.write(f"{'='*100}\n")
-        fh.write(f"\n")
-        
-        writer = csv.DictWriter(fh, fieldnames=fieldnames)
-        writer.writeheader()
-        
-        for r in results:
-            # Build city status description
-            original_city = r.get("original_city", "") or "(empty)"
-            if r.get("city_changed"):
-                new_city = r.get("new_city", "") or "(empty)"
-                city_status = f"city changed from {original_city} to {new_city}"
-            else:
-                city_status = f"city is valid ({original_city})"
-            
-            # Build reseller status description
-            original_reseller = r.get("original_reseller", "") or "(empty)"
-            if r.get("reseller_changed"):
-                new_reseller = r.get("new_reseller", "") or "(empty)"
-                reseller_status = f"reseller changed from {original_reseller} to {new_reseller}"
-            else:
-                reseller_status = f"reseller is valid ({original_reseller})"
-            
-            # Build sector status description
-            original_sector = r.get("original_sector", "") or "(empty)"
-            if r.get("sector_changed"):
-                new_sector = r.get("new_sector", "") or "(empty)"
-                sector_status = f"sector changed from {original_sector} to {new_sector}"
-            else:
-                sector_status = f"sector is valid ({original_sector})"
-            
-            row = {
-                "Player ID": r.get("player_id", ""),
-                "Player Identifier": r.get("identifier", ""),
-                "Site Number": r.get("site_number", ""),
-                "City Status": city_status,
-                "Reseller Status": reseller_status,
-                "Sector Status": sector_status,
-                "Error Message": r.get("error", ""),
-            }
-            writer.writerow(row)
+    fh = output_file.open("w", encoding="utf-8-sig", newline="")
+    # Write explanation header for Notepad readability
+    fh.write(f"Player Validation Results Report\n")
+    fh.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+    fh.write(f"Total players in system: {total_players}\n")
+    fh.write(f"Players checked in this run: {processed_count}\n")
+    fh.write(f"\n")
+    fh.write(f"IMPORTANT NOTES:\n")
+    fh.write(f"- This CSV contains ONLY players with ERRORS or UPDATES\n")
+    fh.write(f"- Players that were OK (no changes needed) are NOT included\n")
+    fh.write(f"- Players not checked remain completely untouched in the system\n")
+    fh.write(f"- This script does NOT delete any players - it only updates data\n")
+    fh.write(f"\n")
+    fh.write(f"{'='*100}\n")
+    fh.write(f"DATA STARTS BELOW\n")
+    fh.write(f"{'='*100}\n")
+    fh.write(f"\n")
+
+    writer = csv.DictWriter(fh, fieldnames=RESULTS_CSV_FIELDNAMES)
+    writer.writeheader()
+    return fh, writer
+
+
+def results_csv_row(r: dict) -> dict:
+    """Build the results CSV row for one checked player."""
+    # Build city status description
+    original_city = r.get("original_city", "") or "(empty)"
+    if r.get("city_changed"):
+        new_city = r.get("new_city", "") or "(empty)"
+        city_status = f"city changed from {original_city} to {new_city}"
+    else:
+        city_status = f"city is valid ({original_city})"
+
+    # Build reseller status description
+    original_reseller = r.get("original_reseller", "") or "(empty)"
+    if r.get("reseller_changed"):
+        new_reseller = r.get("new_reseller", "") or "(empty)"
+        reseller_status = f"reseller changed from {original_reseller} to {new_reseller}"
+    else:
+        reseller_status = f"reseller is valid ({original_reseller})"
+
+    # Build sector status description
+    original_sector = r.get("original_sector", "") or "(empty)"
+    if r.get("sector_changed"):
+        new_sector = r.get("new_sector", "") or "(empty)"
+        sector_status = f"sector changed from {original_sector} to {new_sector}"
+    else:
+        sector_status = f"sector is valid ({original_sector})"
+
+    return {
+        "Player ID": r.get("player_id", ""),
+        "Player Identifier": r.get("identifier", ""),
+        "Site Number": r.get("site_number", ""),
+        "City Status": city_status,
+        "Reseller Status": reseller_status,
+        "Sector Status": sector_status,
+        "Error Message": r.get("error", ""),
+    }
 
 
 def main() -> int:
@@ -679,9 +524,8 @@ def main() -> int:
     dictionaries = load_dictionaries()
     valid_cities = get_all_dictionary_values(dictionaries, "cities_dictionary")
     valid_resellers = get_all_dictionary_values(dictionaries, "reseller_dictionary")
-    valid_sectors = get_all_dictionary_values(dictionaries, "sector_dictionary")
     # Add "GENERAL" to valid sectors
-    valid_sectors.add("GENERAL")
+    valid_sectors = get_all_dictionary_values(dictionaries, "sector_dictionary") | {"GENERAL"}
 
     print(f"[INFO] Loaded {len(valid_cities)} valid city values")
     print(f"[INFO] Loaded {len(valid_resellers)} valid reseller values")
@@ -691,9 +535,9 @@ def main() -> int:
     # Get API credentials
     api_key, organization = get_api_credentials()
 
-    # Fetch all players
-    token = request_token(api_key, organization)
-    all_players = fetch_all_players(token)
+    # One token for the whole run, refreshed only on expiry or 401
+    tm = TokenManager(api_key, organization)
+    all_players = call_with_token(tm, fetch_all_players)
 
     if not all_players:
         print("[ERROR] No players found in the system.")
@@ -702,28 +546,92 @@ def main() -> int:
     # Process all players
     original_total_count = len(all_players)
     print(f"\n[INFO] Processing all {len(all_players)} player(s)...")
+    inline_count = sum(1 for p in all_players if "coordinates" in p and "variables" in p)
+    print(f"[INFO] Player details: {inline_count} from the player list, "
+          f"{len(all_players) - inline_count} fetched per player")
     print("[INFO] This may take a while.\n")
 
-    results = []
     corrected_count = 0
     error_count = 0
+    invalid_city_count = 0
+    invalid_reseller_count = 0
+    invalid_sector_count = 0
+    players_with_errors = []
+
+    # Results are written to CSV as players finish
+    # IMPORTANT: This CSV only includes players that had errors or were updated (changed values)
+    # Players that were OK and didn't need changes are NOT included in this CSV
+    # Players not checked are NOT included in this CSV and remain completely untouched in the system
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    csv_output_file = Path(f"player_validation_results_{timestamp}.csv")
+    csv_fh = None
+    csv_writer = None
+    csv_error = None
+    csv_row_count = 0
+
+    # Build the CSV index before the workers need it
+    load_csv_cached()
+
+    def check_player(player: dict) -> dict:
+        # Buffer the player's output so parallel players do not interleave
+        lines: list[str] = []
+        try:
+            return validate_and_correct_player(
+                player, dictionaries, valid_cities, valid_resellers, valid_sectors, tm, lines.append
+            )
+        finally:
+            with _PRINT_LOCK:
+                print("\n".join(lines), flush=True)
 
     # Process only the limited set of players (e.g., first 100 in test mode)
     # IMPORTANT: Players not in this list are NOT affected - they remain unchanged in the system
     # This script does NOT delete any players, only updates the ones that are processed
-    for i, player in enumerate(all_players, 1):
-        if i % 10 == 0:
-            print(f"[INFO] Processing player {i}/{len(all_players)}...")
-
-        result = validate_and_correct_player(
-            player, dictionaries, valid_cities, valid_resellers, valid_sectors, api_key, organization
-        )
-        results.append(result)
-
-        if result["updated"]:
-            corrected_count += 1
-        if result["error"]:
-            error_count += 1
+    # Players are checked concurrently; results come back in the original order, and only
+    # this (main) thread touches the counters and the results CSV
+    try:
+        with ThreadPoolExecutor(max_workers=MAX_PLAYER_WORKERS) as ex:
+            for i, result in enumerate(ex.map(check_player, all_players), 1):
+                if i % 10 == 0:
+                    with _PRINT_LOCK:
+                        print(f"[INFO] Processed player {i}/{len(all_players)}...")
+
+                if result["updated"]:
+                    corrected_count += 1
+                if result["error"]:
+                    error_count += 1
+                    players_with_errors.append(result)
+                if result["city_invalid"]:
+                    invalid_city_count += 1
+                if result["reseller_invalid"]:
+                    invalid_reseller_count += 1
+                if result["sector_invalid"]:
+                    invalid_sector_count += 1
+
+                if not (result["error"] or result["updated"]):
+                    continue
+                csv_row_count += 1
+                if csv_error is not None:
+                    continue
+                try:
+                    if csv_writer is None:
+                        csv_fh, csv_writer = open_results_csv(
+                            csv_output_file, original_total_count, len(all_players)
+                        )
+                    csv_writer.writerow(results_csv_row(result))
+                    csv_fh.flush()
+                except OSError as exc:
+                    csv_error = exc
+                    with _PRINT_LOCK:
+                        print(f"[ERROR] Failed to write CSV file: {exc}")
+    finally:
+        if csv_fh is not None:
+            try:
+                if csv_error is None:
+                    csv_fh.write(f"\nPlayers in this CSV (with errors or updates): {csv_row_count}\n")
+                csv_fh.close()
+            except OSError as exc:
+                csv_error = csv_error or exc
+                print(f"[ERROR] Failed to write CSV file: {exc}")
 
     # Print summary
     print("\n" + "=" * 60)
@@ -733,38 +641,23 @@ def main() -> int:
     print(f"Players corrected: {corrected_count}")
     print(f"Players with errors: {error_count}")
 
-    invalid_city_count = sum(1 for r in results if r["city_invalid"])
-    invalid_reseller_count = sum(1 for r in results if r["reseller_invalid"])
-    invalid_sector_count = sum(1 for r in results if r["sector_invalid"])
-
     print(f"\nPlayers with invalid city: {invalid_city_count}")
     print(f"Players with invalid reseller: {invalid_reseller_count}")
     print(f"Players with invalid sector: {invalid_sector_count}")
 
     # Show players with errors
-    players_with_errors = [r for r in results if r["error"]]
     if players_with_errors:
         print(f"\nPlayers with errors ({len(players_with_errors)}):")
         for r in players_with_errors:
             print(f"  - {r['identifier']} (ID: {r['player_id']}): {r['error']}")
 
-    # Write results to CSV
-    # IMPORTANT: This CSV only includes players that had errors or were updated (changed values)
-    # Players that were OK and didn't need changes are NOT included in this CSV
-    # Players not checked are NOT included in this CSV and remain completely untouched in the system
-    filtered_results = [r for r in results if r.get("error") or r.get("updated")]
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    csv_output_file = Path(f"player_validation_results_{timestamp}.csv")
-    print(f"\n[INFO] Writing results to CSV: {csv_output_file}")
-    print(f"[INFO] Total players checked: {len(results)}")
-    print(f"[INFO] Players with errors or updates: {len(filtered_results)}")
-    print(f"[INFO] CSV will contain only players with errors or updates (not OK players)")
-    try:
-        write_results_csv(filtered_results, csv_output_file, original_total_count, len(results))
+    print(f"\n[INFO] Total players checked: {len(all_players)}")
+    print(f"[INFO] Players with errors or updates: {csv_row_count}")
+    if csv_writer is None and csv_error is None:
+        print(f"[INFO] No players with errors or updates; no CSV file written")
+    elif csv_error is None:
         print(f"[INFO] CSV file created successfully: {csv_output_file}")
-        print(f"[INFO] CSV contains {len(filtered_results)} player(s) with errors or updates")
-    except Exception as exc:
-        print(f"[ERROR] Failed to write CSV file: {exc}")
+        print(f"[INFO] CSV contains {csv_row_count} player(s) with errors or updates")
 
     return 0
 
@@ -779,10 +672,6 @@ if __name__ == "__main__":
         traceback.print_exc()
         exit_code = 1
     finally:
-        try:
-            print("\nExiting in 15 seconds...")
-            time.sleep(15)
-        except KeyboardInterrupt:
-            pass
+        pause_before_exit(15)
     sys.exit(exit_code)
 